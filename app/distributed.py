@@ -0,0 +1,185 @@
+import os
+import json
+import time
+import uuid
+import socket
+import argparse
+import threading
+from pathlib import Path
+from app.utils import get_files, is_archive, path_from_str
+
+# -----------------------------------------------------------------------------
+# 共享檔案系統上的工作佇列 (lease-file 目錄)
+#   pending/  待處理批次      claimed/  已被 worker 租用 (mtime 即心跳)
+#   done/     完成結果        failed/   超過重試次數
+# 認領以 os.rename 原子搬移完成，NAS 上不需要檔案鎖；SQLite 在 NFS/SMB 上鎖定不可靠故不採用
+# -----------------------------------------------------------------------------
+TASK_FILE_TYPES = {'task_video_sharpen': 'video', 'task_rename_replace': 'all'}
+
+def _write_json(path, data, tmp_dir):
+    tmp = Path(tmp_dir) / f"{uuid.uuid4().hex}.tmp"
+    tmp.write_text(json.dumps(data, ensure_ascii=False), encoding='utf-8'); os.replace(tmp, path)
+
+class JobQueue:
+    def __init__(self, root, lease_seconds=600, max_attempts=3):
+        self.root = Path(root); self.lease_seconds = lease_seconds; self.max_attempts = max_attempts
+        for d in ('pending', 'claimed', 'done', 'failed', 'tmp'): (self.root / d).mkdir(parents=True, exist_ok=True)
+
+    def _d(self, name): return self.root / name
+
+    def submit(self, task_name, input_path, output_path, task_kwargs, files, batch_size=20):
+        # 協調者：把輸入切成批次寫入 pending/，回傳 (run_id, 批次數)
+        files = [str(f) for f in files]; run_id = f"{time.strftime('%Y%m%d%H%M%S')}{uuid.uuid4().hex[:4]}"; n = 0
+        for i in range(0, len(files), batch_size):
+            job_id = f"{run_id}-{i // batch_size:06d}"
+            job = {'id': job_id, 'task': task_name, 'input_path': str(input_path), 'output_path': output_path and str(output_path),
+                   'kwargs': task_kwargs, 'files': files[i:i + batch_size], 'attempts': 0}
+            _write_json(self._d('pending') / f"{job_id}.json", job, self._d('tmp')); n += 1
+        return run_id, n
+
+    def claim(self, worker_id):
+        for p in sorted(self._d('pending').glob('*.json')):
+            claimed = self._d('claimed') / f"{p.stem}~{worker_id}.json"
+            try: os.rename(p, claimed)
+            except OSError: continue  # 被其他 worker 搶先
+            os.utime(claimed)
+            return claimed, json.loads(claimed.read_text(encoding='utf-8'))
+        return None
+
+    def heartbeat(self, claimed):
+        try: os.utime(claimed); return True
+        except OSError: return False  # 租約已被回收
+
+    def _release(self, claimed):
+        # 先把租約原子搬離 claimed/；失敗代表已被 reap_stale 回收並重新排入，結果不可再發布
+        grab = self._d('tmp') / f"done-{uuid.uuid4().hex}.json"
+        try: os.rename(claimed, grab); return grab
+        except OSError: return None
+
+    def complete(self, claimed, job, result):
+        grab = self._release(claimed)
+        if grab is None: return False
+        _write_json(self._d('done') / f"{job['id']}.json", {**job, 'result': result}, self._d('tmp')); os.remove(grab)
+        return True
+
+    def fail(self, claimed, job, error):
+        grab = self._release(claimed)
+        if grab is None: return False
+        job = {**job, 'attempts': job.get('attempts', 0) + 1, 'error': error}
+        dest = 'failed' if job['attempts'] >= self.max_attempts else 'pending'
+        _write_json(self._d(dest) / f"{job['id']}.json", job, self._d('tmp')); os.remove(grab)
+        return True
+
+    def reap_stale(self):
+        # 心跳逾時的租約放回 pending；先原子搬到 tmp/，確保同時只有一個回收者
+        now = time.time(); n = 0
+        for p in self._d('claimed').glob('*.json'):
+            try:
+                if now - p.stat().st_mtime < self.lease_seconds: continue
+                grab = self._d('tmp') / f"reap-{uuid.uuid4().hex}.json"; os.rename(p, grab)
+            except OSError: continue
+            job = json.loads(grab.read_text(encoding='utf-8')); job['attempts'] = job.get('attempts', 0) + 1
+            job['error'] = f"租約逾時 ({p.stem.partition('~')[2]})"
+            dest = 'failed' if job['attempts'] >= self.max_attempts else 'pending'
+            _write_json(self._d(dest) / f"{job['id']}.json", job, self._d('tmp')); os.remove(grab); n += 1
+        return n
+
+    def status(self, run_id=''):
+        return {d: sum(1 for _ in self._d(d).glob(f'{run_id}*.json')) for d in ('pending', 'claimed', 'done', 'failed')}
+
+    def results(self, state='done', run_id=''):
+        out = []
+        for p in sorted(self._d(state).glob(f'{run_id}*.json')):
+            try: out.append(json.loads(p.read_text(encoding='utf-8')))
+            except (OSError, ValueError): pass
+        return out
+
+# -----------------------------------------------------------------------------
+# Worker：無介面常駐，持續認領批次並在同一行程內執行 task
+# -----------------------------------------------------------------------------
+def _noop(*_): pass
+
+def run_job(job, log_callback=print):
+    import app.logic as logic
+    errors = []
+    def log(msg):
+        if msg.startswith("❌"): errors.append(msg)
+        log_callback(msg)
+    kw = dict(job['kwargs']); kw.pop('files', None)
+    if job.get('output_path'): kw['output_path'] = job['output_path']
+    t0 = time.perf_counter()
+    getattr(logic, job['task'])(log_callback=log, progress_callback=_noop, current_file_callback=_noop, file_progress_callback=_noop,
+                                input_path=job['input_path'], files=[path_from_str(f) for f in job['files']], **kw)
+    return {'files': len(job['files']), 'errors': errors, 'seconds': time.perf_counter() - t0}
+
+def run_worker(queue_dir, worker_id=None, poll=2.0, exit_when_idle=False, should_stop=lambda: False, log_callback=print, **queue_kw):
+    q = JobQueue(queue_dir, **queue_kw); worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"; done = 0
+    log_callback(f"🛠️ [Worker {worker_id}] 啟動: {queue_dir}")
+    while not should_stop():
+        q.reap_stale(); got = q.claim(worker_id)
+        if not got:
+            if exit_when_idle and not q.status()['claimed']: break
+            time.sleep(poll); continue
+        claimed, job = got; stop_hb = threading.Event(); lost = threading.Event()
+        def beat():
+            while not stop_hb.wait(q.lease_seconds / 3):
+                if not q.heartbeat(claimed): lost.set(); break  # 租約已被回收
+        hb = threading.Thread(target=beat, daemon=True); hb.start()
+        try:
+            result = run_job(job, log_callback); result.update(worker=worker_id, host=socket.gethostname())
+            if not lost.is_set() and q.complete(claimed, job, result):
+                done += 1; log_callback(f"✅ [Worker {worker_id}] {job['id']} ({result['files']} 檔, {len(result['errors'])} 錯誤, {result['seconds']:.1f}s)")
+            else: log_callback(f"⚠️ [Worker {worker_id}] {job['id']} 租約已失效，結果捨棄 (已由其他 worker 重新處理)")
+        except Exception as e:
+            if not lost.is_set() and q.fail(claimed, job, f"{worker_id}: {e}"): log_callback(f"❌ [Worker {worker_id}] {job['id']}: {e}")
+            else: log_callback(f"⚠️ [Worker {worker_id}] {job['id']} 租約已失效: {e}")
+        finally:
+            stop_hb.set(); hb.join()
+    log_callback(f"🏁 [Worker {worker_id}] 結束，共完成 {done} 批")
+    return done
+
+# -----------------------------------------------------------------------------
+# 協調者：列舉輸入、送出批次並彙整結果
+# -----------------------------------------------------------------------------
+def task_distribute(log_callback, progress_callback, current_file_callback, file_progress_callback, queue_dir, task_name, input_path, recursive,
+                    output_path=None, batch_size=20, wait=True, poll=2.0, task_kwargs=None, **queue_kw):
+    if output_path and is_archive(output_path):
+        # 各批次各自呼叫 task，封存輸出會被每批覆寫；多台主機也無法同時寫入同一封存
+        log_callback("❌ 分散式模式不支援封存檔輸出，請改用資料夾"); return None
+    q = JobQueue(queue_dir, **queue_kw)
+    files = get_files(input_path, recursive, file_types=TASK_FILE_TYPES.get(task_name, 'image'))
+    kw = {'recursive': recursive, **(task_kwargs or {})}
+    run_id, n = q.submit(task_name, input_path, output_path, kw, files, batch_size)
+    log_callback(f"📤 [Distribute] {task_name}: {len(files)} 檔切成 {n} 批 -> {queue_dir}")
+    if not wait: return q.status(run_id)
+    while True:
+        q.reap_stale(); st = q.status(run_id); fin = st['done'] + st['failed']
+        current_file_callback(f"待處理 {st['pending']} · 處理中 {st['claimed']} · 完成 {st['done']} · 失敗 {st['failed']}")
+        progress_callback(int(fin / max(1, fin + st['pending'] + st['claimed']) * 100))
+        if not st['pending'] and not st['claimed']: break
+        time.sleep(poll)
+    done, failed = q.results('done', run_id), q.results('failed', run_id)
+    for j in done:
+        for e in j['result']['errors']: log_callback(f"{e} [{j['result']['worker']}]")
+    for j in failed: log_callback(f"❌ 批次 {j['id']} 失敗 ({len(j['files'])} 檔): {j.get('error')}")
+    log_callback(f"🏁 [Distribute] 完成 {len(done)} 批 / 失敗 {len(failed)} 批"); progress_callback(100)
+    return q.status(run_id)
+
+if __name__ == "__main__":
+    # python -m app.distributed submit QUEUE config.json   (config 與 app.watch 相同格式，另可加 batch_size)
+    # python -m app.distributed worker QUEUE [--once]
+    # python -m app.distributed status QUEUE
+    ap = argparse.ArgumentParser(prog="app.distributed"); sp = ap.add_subparsers(dest='cmd', required=True)
+    a = sp.add_parser('submit'); a.add_argument('queue'); a.add_argument('config'); a.add_argument('--no-wait', action='store_true')
+    a = sp.add_parser('worker'); a.add_argument('queue'); a.add_argument('--id'); a.add_argument('--once', action='store_true')
+    a = sp.add_parser('status'); a.add_argument('queue')
+    for a in sp.choices.values(): a.add_argument('--lease', type=float, default=600)
+    args = ap.parse_args()
+    if args.cmd == 'submit':
+        cfg = json.loads(Path(args.config).read_text(encoding='utf-8')); kw = dict(cfg.get('kwargs', {}))
+        task_distribute(print, _noop, _noop, _noop, args.queue, cfg['task'], cfg['input_path'], cfg.get('recursive', True),
+                        output_path=cfg.get('output_path'), batch_size=cfg.get('batch_size', 20), wait=not args.no_wait, task_kwargs=kw, lease_seconds=args.lease)
+    elif args.cmd == 'worker':
+        run_worker(args.queue, args.id, exit_when_idle=args.once, lease_seconds=args.lease)
+    else:
+        print(json.dumps(JobQueue(args.queue, lease_seconds=args.lease).status()))
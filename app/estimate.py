@@ -0,0 +1,88 @@
+import os
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from PIL import Image
+from app.utils import get_files, ArchiveMember
+
+# -----------------------------------------------------------------------------
+# 預檢：只讀圖檔標頭取得尺寸，以像素量 (百萬像素) 作為工作量權重
+# -----------------------------------------------------------------------------
+FILE_OVERHEAD_MP = 0.05  # 每檔固定開銷 (開檔/編碼/寫入) 折算的像素量，避免縮圖權重趨近 0
+
+def read_image_size(fp):
+    # Image.open 為延遲載入，只解析標頭不解碼像素
+    try:
+        if isinstance(fp, ArchiveMember):
+            with fp.open() as f, Image.open(f) as img: return img.size
+        with Image.open(fp) as img: return img.size
+    except Exception: return (0, 0)
+
+def preflight_images(files, max_workers=8):
+    files = list(files)
+    with ThreadPoolExecutor(max_workers=max_workers) as ex: sizes = list(ex.map(read_image_size, files))
+    return dict(zip(files, sizes))
+
+def work_weight(size): return size[0] * size[1] / 1e6 + FILE_OVERHEAD_MP
+
+def format_eta(sec):
+    if sec is None: return "--:--"
+    sec = int(sec); h, m, s = sec // 3600, sec % 3600 // 60, sec % 60
+    return f"{h}:{m:02d}:{s:02d}" if h else f"{m:02d}:{s:02d}"
+
+# -----------------------------------------------------------------------------
+# 實測吞吐量紀錄 (MP/s)，供下次預估與 ETA 起始值使用
+# -----------------------------------------------------------------------------
+def _throughput_path():
+    return Path(os.environ.get('FILE_APP_CACHE_DIR') or Path.home() / '.cache' / 'file_app') / 'throughput.json'
+
+def load_throughput(task_name):
+    try: return json.loads(_throughput_path().read_text(encoding='utf-8')).get(task_name)
+    except (OSError, ValueError): return None
+
+def save_throughput(task_name, mp_per_sec):
+    p = _throughput_path()
+    try: data = json.loads(p.read_text(encoding='utf-8'))
+    except (OSError, ValueError): data = {}
+    old = data.get(task_name)
+    data[task_name] = mp_per_sec if not old else old * 0.5 + mp_per_sec * 0.5
+    try: p.parent.mkdir(parents=True, exist_ok=True); p.write_text(json.dumps(data), encoding='utf-8')
+    except OSError: pass
+
+class WorkProgress:
+    # 以像素量加權的進度與 ETA；結束時把實測吞吐量寫回紀錄
+    def __init__(self, task_name, files, progress_callback):
+        self.task_name = task_name; self.progress_callback = progress_callback
+        self.weights = {fp: work_weight(sz) for fp, sz in preflight_images(files).items()}
+        self.total = sum(self.weights.values()) or 1.0; self.done = 0.0
+        self.rate = load_throughput(task_name); self.t0 = time.perf_counter()
+
+    def percent(self): return int(self.done / self.total * 100)
+
+    def eta(self):
+        el = time.perf_counter() - self.t0
+        rate = self.done / el if self.done and el > 0.5 else self.rate
+        return (self.total - self.done) / rate if rate else None
+
+    def label(self, fp): return f"{fp.name} · 剩餘 {format_eta(self.eta())}"
+
+    def advance(self, fp):
+        self.done += self.weights.get(fp, FILE_OVERHEAD_MP); self.progress_callback(min(100, self.percent()))
+
+    def finish(self):
+        el = time.perf_counter() - self.t0
+        if el > 1.0 and self.done: save_throughput(self.task_name, self.done / el)
+
+def task_preflight(log_callback, progress_callback, current_file_callback, file_progress_callback, input_path, recursive, task_name):
+    # 乾跑：不處理任何檔案，只統計尺寸並依過去實測吞吐量估算耗時
+    log_callback("🔎 [Preflight] 讀取標頭中..."); files = get_files(input_path, recursive, file_types='image')
+    sizes = preflight_images(files); total = sum(work_weight(s) for s in sizes.values()); rate = load_throughput(task_name)
+    bad = [fp.name for fp, s in sizes.items() if s == (0, 0)]
+    mps = sorted((s[0] * s[1] / 1e6 for s in sizes.values()), reverse=True)
+    log_callback(f"📐 {len(files)} 檔 · 共 {total:.1f} MP (含每檔開銷) · 最大 {mps[0] if mps else 0:.1f} MP · 前 1% 檔案佔 {sum(mps[:max(1, len(mps)//100)]) / (sum(mps) or 1) * 100:.0f}% 像素")
+    if bad: log_callback(f"⚠️ {len(bad)} 檔無法讀取標頭: {', '.join(bad[:5])}{' ...' if len(bad) > 5 else ''}")
+    if rate: log_callback(f"⏱️ 預估耗時 {format_eta(total / rate)} (實測吞吐量 {rate:.1f} MP/s)")
+    else: log_callback("⏱️ 尚無此功能的實測吞吐量，完整執行一次後即可預估")
+    progress_callback(100); current_file_callback("Done")
+    return {'files': len(files), 'total_mp': total, 'mp_per_sec': rate, 'eta_sec': total / rate if rate else None}
@@ -4,9 +4,16 @@ import random
 import subprocess
 import json
 import re
+import time
+import tempfile
+import threading
+from collections import OrderedDict
+from functools import wraps
 from pathlib import Path
 from PIL import Image, ImageEnhance, ImageChops, ImageDraw, ImageFilter
-from app.utils import get_files, is_ffmpeg_installed, get_video_duration
+from app.utils import get_files, is_ffmpeg_installed, probe_many, rel_parent, remove_source, prepare_output, ArchiveMember
+from app.pipeline import prefetch_files, open_image, encode_image, encode_animation, AsyncWriter
+from app.estimate import WorkProgress
 
 # -----------------------------------------------------------------------------
 # 輔助函式
@@ -65,6 +72,72 @@ def create_gradient_image(size, start_hex, end_hex, angle):
     for y in range(diag): draw.line([(0, y), (diag, y)], fill=int(255 * (y / diag)))
     return Image.composite(top, base, mask.rotate(angle)).crop(((diag - w) // 2, (diag - h) // 2, (diag - w) // 2+w, (diag - h) // 2+h))
 
+def _image_lru(max_bytes):
+    # 以像素位元組數為上限的 LRU：整批共用素材圖，但不讓大尺寸畫布無限期佔住記憶體
+    def deco(fn):
+        cache = OrderedDict(); lock = threading.Lock(); used = [0]
+        @wraps(fn)
+        def wrapper(*args):
+            with lock:
+                if args in cache: cache.move_to_end(args); return cache[args]
+            img = fn(*args); nb = img.width * img.height * len(img.getbands())
+            with lock:
+                if nb <= max_bytes and args not in cache:
+                    cache[args] = img; used[0] += nb
+                    while used[0] > max_bytes: _, old = cache.popitem(last=False); used[0] -= old.width * old.height * len(old.getbands())
+            return img
+        def cache_clear():
+            with lock: cache.clear(); used[0] = 0
+        wrapper.cache_clear = cache_clear
+        return wrapper
+    return deco
+
+@_image_lru(256 << 20)
+def _cached_gradient(size, start_hex, end_hex, angle):
+    # 漸層逐行繪製成本高，同尺寸同參數時直接重用 (呼叫端若要修改需先 copy)
+    return create_gradient_image(size, start_hex, end_hex, angle)
+
+@_image_lru(256 << 20)
+def _load_material(path, size, mtime):
+    # 填充/背景素材圖在整批處理與預覽中反覆使用，依路徑+尺寸+修改時間快取
+    with Image.open(path) as m: return m.convert('RGBA').resize(size)
+
+def split_alpha_masks(img):
+    a = img.getchannel('A')
+    mask_op = a.point(lambda x: 255 if x >= 250 else 0, 'L')
+    mask_tr = a.point(lambda x: 255 if x <= 10 else 0, 'L')
+    mask_se = ImageChops.invert(ImageChops.add(mask_op, mask_tr))
+    return mask_op, mask_tr, mask_se
+
+def make_preview_proxy(path, max_side=480):
+    # 預覽用縮圖：JPEG 走 draft 直接以低解析度解碼，再一併算好 alpha 遮罩供後續重用
+    with (path.open() if isinstance(path, ArchiveMember) else open(path, 'rb')) as f, Image.open(f) as img:
+        img.draft('RGB', (max_side, max_side))
+        proxy = img.convert('RGBA')
+    proxy.thumbnail((max_side, max_side), Image.Resampling.BILINEAR)
+    return proxy, split_alpha_masks(proxy)
+
+def resize_enhance(img, size, sharpen_factor=1.0, brightness_factor=1.0):
+    # 合併 resize + Sharpness + Brightness：銳利化 (SMOOTH 與原圖的線性混合) 折成單一 3x3 kernel，
+    # 亮度改為 LUT，省去 ImageEnhance 的 degenerate/blend 中間圖。
+    # 與 ImageEnhance 的差異：kernel 少一次捨入，銳利化 5 時最多 2 階，再被亮度 LUT 依倍率放大
+    # (銳利化 5 / 亮度 5 最多約 10 階，平均約 0.3 階)；純亮度調整與 ImageEnhance 逐點一致
+    if size != img.size: img = img.resize(size, Image.Resampling.LANCZOS)
+    if img.mode not in ('L', 'RGB', 'RGBA'):
+        if sharpen_factor != 1: img = ImageEnhance.Sharpness(img).enhance(sharpen_factor)
+        if brightness_factor != 1: img = ImageEnhance.Brightness(img).enhance(brightness_factor)
+        return img
+    alpha = img.getchannel('A') if img.mode == 'RGBA' and sharpen_factor != 1 else None
+    if sharpen_factor != 1:
+        o = (1 - sharpen_factor) / 13.0; c = (1 - sharpen_factor) * 5 / 13.0 + sharpen_factor
+        img = img.filter(ImageFilter.Kernel((3, 3), [o, o, o, o, c, o, o, o, o], scale=1))
+        if alpha: img.putalpha(alpha)
+    if brightness_factor != 1:
+        # LUT 直接取樣 ImageEnhance.Brightness (float32 混合後截斷)，與原本逐點一致
+        lut = list(ImageEnhance.Brightness(Image.frombytes('L', (256, 1), bytes(range(256)))).enhance(brightness_factor).tobytes())
+        img = img.point(lut * 3 + list(range(256)) if img.mode == 'RGBA' else lut * len(img.getbands()))
+    return img
+
 def get_color_match_mask(img_rgba, target_color_hex, tolerance=40):
     try:
         c = target_color_hex.lstrip('#')
@@ -78,12 +151,13 @@ def get_color_match_mask(img_rgba, target_color_hex, tolerance=40):
 # -----------------------------------------------------------------------------
 # Fill Logic
 # -----------------------------------------------------------------------------
-def process_single_image_fill(img, opaque_sets, trans_sets, semi_sets, bg_sets, crop_sets):
+def process_single_image_fill(img, opaque_sets, trans_sets, semi_sets, bg_sets, crop_sets, masks=None, box=None, shared=None):
+    # box: img 為整張畫布中的局部區域時，其在畫布上的位置；漸層/素材/形狀遮罩依畫布尺寸產生後再裁切
+    # shared: 動畫各影格共用的快取 (畫布尺寸、形狀遮罩)，確保隨機雲狀等每格一致
     if img.mode != 'RGBA': img = img.convert('RGBA')
-    w, h = img.size; r, g, b, a = img.split()
-    mask_op = a.point(lambda x: 255 if x >= 250 else 0, 'L')
-    mask_tr = a.point(lambda x: 255 if x <= 10 else 0, 'L')
-    mask_se = ImageChops.invert(ImageChops.add(mask_op, mask_tr))
+    w, h = img.size; cw, ch = (shared or {}).get('canvas', (w, h))
+    fit = (lambda layer: layer.crop(box)) if box else (lambda layer: layer)
+    mask_op, mask_tr, mask_se = masks if masks else split_alpha_masks(img)
     final = img.copy()
 
     def proc_layer(base, region_mask, s):
@@ -95,9 +169,9 @@ def process_single_image_fill(img, opaque_sets, trans_sets, semi_sets, bg_sets,
         if not final_mask.getbbox(): return base
         fill_layer = None; fmod = s.get('fill_mode')
         if fmod == 'color': fill_layer = Image.new('RGBA', (w,h), s.get('fill_color'))
-        elif fmod == 'gradient': g=s.get('fill_gradient',{}); fill_layer = create_gradient_image((w,h), g.get('start'), g.get('end'), g.get('angle', 0))
+        elif fmod == 'gradient': g=s.get('fill_gradient',{}); fill_layer = fit(_cached_gradient((cw,ch), g.get('start'), g.get('end'), g.get('angle', 0)))
         elif fmod == 'image' and os.path.exists(s.get('fill_image_path', '')):
-            try: fill_layer = Image.open(s.get('fill_image_path')).convert('RGBA').resize((w,h))
+            try: fp = s.get('fill_image_path'); fill_layer = fit(_load_material(fp, (cw,ch), os.path.getmtime(fp)))
             except: pass
         if fill_layer: base = Image.composite(fill_layer, base, final_mask)
         if s.get('trans_mode') == 'change':
@@ -112,9 +186,9 @@ def process_single_image_fill(img, opaque_sets, trans_sets, semi_sets, bg_sets,
     if bg_sets and bg_sets.get('enabled'):
         bg_layer = None; bt = bg_sets.get('material_type')
         if bt == 'color': bg_layer = Image.new('RGBA', (w,h), bg_sets.get('color'))
-        elif bt == 'gradient': g=bg_sets.get('gradient',{}); bg_layer = create_gradient_image((w,h), g.get('start'), g.get('end'), g.get('angle', 0))
+        elif bt == 'gradient': g=bg_sets.get('gradient',{}); bg_layer = _cached_gradient((cw,ch), g.get('start'), g.get('end'), g.get('angle', 0)).crop(box)
         elif bt == 'image' and os.path.exists(bg_sets.get('image_path', '')):
-            try: bg_layer = Image.open(bg_sets.get('image_path')).convert('RGBA').resize((w,h))
+            try: fp = bg_sets.get('image_path'); bg_layer = _load_material(fp, (cw,ch), os.path.getmtime(fp)).crop(box)
             except: pass
         if bg_layer:
             mode = bg_sets.get('mode')
@@ -129,91 +203,246 @@ def process_single_image_fill(img, opaque_sets, trans_sets, semi_sets, bg_sets,
 
     if crop_sets:
         shape = crop_sets.get('shape')
-        if shape and shape != '無': final.putalpha(ImageChops.multiply(final.split()[3], create_shape_mask((w,h), shape)))
+        if shape and shape != '無':
+            if shared is not None and shared.get('shape') != shape: shared['shape'], shared['shape_mask'] = shape, create_shape_mask((cw,ch), shape)
+            sm = fit(shared['shape_mask']) if shared is not None else create_shape_mask((w,h), shape)
+            final.putalpha(ImageChops.multiply(final.split()[3], sm))
         if crop_sets.get('trim'): final = final.crop(final.getbbox())
     return final
 
+# -----------------------------------------------------------------------------
+# Animated Images
+# -----------------------------------------------------------------------------
+# 可保留動畫的輸出格式 (PNG 會存成 APNG)
+ANIMATED_EXTS = {'.gif', '.png', '.webp'}
+
+def is_animated(img): return getattr(img, 'is_animated', False) and getattr(img, 'n_frames', 1) > 1
+
+def read_frames(img):
+    # 逐格讀出完整合成後的 RGBA 畫面與各格時長；來源沒有 loop 資訊 (只播一次) 時回傳 None
+    loop = img.info.get('loop'); frames, durations = [], []
+    for i in range(img.n_frames):
+        img.seek(i); frames.append(img.convert('RGBA')); durations.append(img.info.get('duration', 100))
+    return frames, durations, loop
+
+def frame_diff_bbox(a, b): return ImageChops.difference(a, b).getbbox(alpha_only=False)
+
+def process_animated_fill(frames, opaque_sets, trans_sets, semi_sets, bg_sets, crop_sets):
+    # 每格只重算與前一格不同的區域，其餘沿用上一格結果；素材/漸層/形狀遮罩整段動畫共用
+    shared = {'canvas': frames[0].size}; crop_frame = {**(crop_sets or {}), 'trim': False}
+    out = []; prev_src = prev_out = None
+    for fr in frames:
+        bbox = frame_diff_bbox(fr, prev_src) if prev_src else None
+        if prev_src is None or bbox == (0, 0) + fr.size: res = process_single_image_fill(fr, opaque_sets, trans_sets, semi_sets, bg_sets, crop_frame, shared=shared)
+        elif bbox is None: res = prev_out
+        else:
+            part = process_single_image_fill(fr.crop(bbox), opaque_sets, trans_sets, semi_sets, bg_sets, crop_frame, box=bbox, shared=shared)
+            res = prev_out.copy(); res.paste(part, bbox[:2])
+        out.append(res); prev_src, prev_out = fr, res
+    if crop_sets and crop_sets.get('trim'):
+        # 貼合裁切取所有影格的聯集範圍，各格對齊不跳動
+        boxes = [b for b in (f.getbbox() for f in out) if b]
+        if boxes: u = (min(b[0] for b in boxes), min(b[1] for b in boxes), max(b[2] for b in boxes), max(b[3] for b in boxes)); out = [f.crop(u) for f in out]
+    return out
+
+def scale_animated_frames(frames, size, sharpen_factor=1.0, brightness_factor=1.0):
+    # 變動區域換算到輸出座標並外擴 (LANCZOS 取樣半徑 + 銳利化 1px)，只重採樣這一塊再貼回上一格結果
+    w, h = frames[0].size; nw, nh = size; sx, sy = nw / w, nh / h
+    mx, my = math.ceil(3 * max(1, sx)) + 2, math.ceil(3 * max(1, sy)) + 2
+    out = []; prev_src = prev_out = None
+    for fr in frames:
+        bbox = frame_diff_bbox(fr, prev_src) if prev_src else None
+        if prev_src is None or bbox == (0, 0, w, h): res = resize_enhance(fr, size, sharpen_factor, brightness_factor)
+        elif bbox is None: res = prev_out
+        else:
+            x0, y0 = max(0, math.floor(bbox[0] * sx) - mx), max(0, math.floor(bbox[1] * sy) - my)
+            x1, y1 = min(nw, math.ceil(bbox[2] * sx) + mx), min(nh, math.ceil(bbox[3] * sy) + my)
+            ex0, ey0, ex1, ey1 = max(0, x0 - 1), max(0, y0 - 1), min(nw, x1 + 1), min(nh, y1 + 1)
+            part = fr.resize((ex1 - ex0, ey1 - ey0), Image.Resampling.LANCZOS, box=(ex0 / sx, ey0 / sy, ex1 / sx, ey1 / sy)) if size != (w, h) else fr.crop((ex0, ey0, ex1, ey1))
+            part = resize_enhance(part, part.size, sharpen_factor, brightness_factor).crop((x0 - ex0, y0 - ey0, x1 - ex0, y1 - ey0))
+            res = prev_out.copy(); res.paste(part, (x0, y0))
+        out.append(res); prev_src, prev_out = fr, res
+    return out
+
+# -----------------------------------------------------------------------------
+# Video Encode Planning
+# -----------------------------------------------------------------------------
+# MP4 可直接封裝的音訊編碼；其餘 (pcm/vorbis/...) 需轉 AAC
+MP4_AUDIO_CODECS = {'aac', 'mp3', 'ac3', 'eac3', 'alac'}
+# 可轉成 MP4 mov_text 的文字字幕；PGS/DVD 等點陣字幕無法放進 MP4
+TEXT_SUB_CODECS = {'subrip', 'srt', 'ass', 'ssa', 'mov_text', 'webvtt', 'text'}
+VIDEO_ROUTE_LABELS = {'remux': "📦 直接封裝 (remux)", 'audio': "🔊 僅轉音訊", 'encode': "🎞️ 重新編碼"}
+# libx264 編碼設定檔；threads / filter_threads 為 0 時交給 ffmpeg 自動決定 (用滿所有核心)
+# parallel 限制執行緒，供同機多支影片同時編碼 (監看模式、分散式 worker 多開)
+ENCODER_PROFILES = {
+    'balanced': {'label': "標準 (medium)", 'preset': 'medium', 'crf': 23, 'tune': '', 'threads': 0, 'filter_threads': 0},
+    'quality': {'label': "高畫質 (slow)", 'preset': 'slow', 'crf': 20, 'tune': '', 'threads': 0, 'filter_threads': 0},
+    'fast': {'label': "快速 (faster)", 'preset': 'faster', 'crf': 23, 'tune': '', 'threads': 0, 'filter_threads': 0},
+    'parallel': {'label': "多工並行 (medium, 4 執行緒)", 'preset': 'medium', 'crf': 23, 'tune': '', 'threads': 4, 'filter_threads': 2},
+    'proxy': {'label': "代理檔 (veryfast)", 'preset': 'veryfast', 'crf': 26, 'tune': 'fastdecode', 'threads': 0, 'filter_threads': 0},
+    'draft': {'label': "草稿 (ultrafast)", 'preset': 'ultrafast', 'crf': 28, 'tune': 'zerolatency', 'threads': 0, 'filter_threads': 0},
+}
+
+def encoder_args(profile):
+    p = ENCODER_PROFILES.get(profile, profile) if isinstance(profile, str) else profile
+    args = ["-c:v", "libx264", "-preset", p.get('preset', 'medium'), "-crf", str(p.get('crf', 23))]
+    if p.get('tune'): args.extend(["-tune", p['tune']])
+    if p.get('threads'): args.extend(["-threads", str(p['threads'])])
+    return args
+
+def encoder_global_args(profile):
+    p = ENCODER_PROFILES.get(profile, profile) if isinstance(profile, str) else profile
+    return ["-filter_threads", str(p['filter_threads'])] if p.get('filter_threads') else []
+
+def build_video_filters(info, luma_m_size, luma_amount, scale_mode, scale_value):
+    filters = []
+    if luma_amount > 0: filters.append(f"unsharp={luma_m_size}:{luma_m_size}:{luma_amount}")
+    if scale_mode == 'ratio' and scale_value != 1: filters.append(f"scale=iw*{scale_value}:-2")
+    elif scale_mode in ['hd1080', 'hd720']:
+        px = 1080 if scale_mode == 'hd1080' else 720
+        # 短邊已是目標尺寸時 scale 不會改變畫面，省略以便走 remux
+        if min(info.get('width') or 0, info.get('height') or 0) != px: filters.append(f"scale='if(lt(iw,ih),{px},-2)':'if(lt(iw,ih),-2,{px})'")
+    return filters
+
+def plan_video_encode(info, filters, convert_h264, out_ext, profile='balanced'):
+    # 依探測結果選最便宜的可行路徑：remux < 僅轉音訊 < 完整重新編碼
+    h264_ok = info.get('vcodec') == 'h264' and info.get('pix_fmt') in ('', 'yuv420p', 'yuvj420p')
+    if filters or (convert_h264 and not h264_ok): route, v_args = 'encode', encoder_args(profile)
+    else: route, v_args = 'remux', ["-c:v", "copy"]
+    a_args = ["-c:a", "copy"]
+    if out_ext.lower() == '.mp4' and info.get('acodec') and info['acodec'] not in MP4_AUDIO_CODECS:
+        a_args = ["-c:a", "aac", "-b:a", "192k"]
+        if route == 'remux': route = 'audio'
+    s_args = []
+    if info.get('subtitle_streams'):
+        # 同容器直接複製字幕；輸出 MP4 時文字字幕轉 mov_text，點陣字幕 (或舊快取無字幕編碼資訊) 則捨棄
+        if out_ext.lower() != '.mp4': s_args = ["-c:s", "copy"]
+        else: s_args = ["-c:s", "mov_text"] if info.get('scodecs') and set(info['scodecs']) <= TEXT_SUB_CODECS else ["-sn"]
+    return route, v_args, a_args, s_args
+
 # -----------------------------------------------------------------------------
 # Tasks
 # -----------------------------------------------------------------------------
-def task_image_fill(log_callback, progress_callback, current_file_callback, file_progress_callback, input_path, output_path, recursive, settings_opaque, settings_trans, settings_semi, bg_settings, crop_settings, delete_original, output_format):
-    log_callback("🚀 [Smart Fill] 開始"); files = get_files(input_path, recursive, file_types='image'); total = len(files); out_base = Path(output_path); out_base.mkdir(parents=True, exist_ok=True)
+def task_image_fill(log_callback, progress_callback, current_file_callback, file_progress_callback, input_path, output_path, recursive, settings_opaque, settings_trans, settings_semi, bg_settings, crop_settings, delete_original, output_format, files=None):
+    log_callback("🚀 [Smart Fill] 開始"); files = files if files is not None else get_files(input_path, recursive, file_types='image'); prog = WorkProgress('task_image_fill', files, progress_callback); out_base = prepare_output(output_path)
     ext_map = {'png':'.png', 'jpg':'.jpg', 'webp':'.webp'}; tgt_ext = ext_map.get(output_format.lower(), '.png')
-    for i, fp in enumerate(files):
-        try:
-            progress_callback(int((i/total)*100)); current_file_callback(fp.name); file_progress_callback(0)
-            dest = out_base / (fp.relative_to(Path(input_path)).parent if Path(input_path).is_dir() else fp.parent.name); dest.mkdir(parents=True, exist_ok=True)
-            with Image.open(fp) as img:
-                res = process_single_image_fill(img, settings_opaque, settings_trans, settings_semi, bg_settings, crop_settings)
-                fmt = output_format.upper(); 
-                if fmt == 'JPG': bg = Image.new("RGB", res.size, (255,255,255)); bg.paste(res, mask=res.split()[3]); res = bg; fmt = 'JPEG'
-                res.save(dest / f"{fp.stem}{tgt_ext}", format=fmt, quality=95); log_callback(f"🎨 完成: {fp.name}")
-            if delete_original: os.remove(fp)
-            file_progress_callback(100)
-        except Exception as e: log_callback(f"❌ {fp.name}: {e}")
-    progress_callback(100); current_file_callback("Done"); file_progress_callback(100); log_callback("🏁 結束")
+    with AsyncWriter(log_callback=log_callback, output_path=output_path) as writer:
+        for fp, data in prefetch_files(files):
+            try:
+                current_file_callback(prog.label(fp)); file_progress_callback(0)
+                if isinstance(data, Exception): raise data
+                dest = out_base / rel_parent(fp, input_path)
+                out_fp = dest / f"{fp.stem}{tgt_ext}"
+                with open_image(data) as img:
+                    if is_animated(img) and tgt_ext in ANIMATED_EXTS:
+                        frames, durations, loop = read_frames(img)
+                        res = process_animated_fill(frames, settings_opaque, settings_trans, settings_semi, bg_settings, crop_settings)
+                        out = [(out_fp, encode_animation(res, durations, loop, out_fp, format=output_format.upper(), quality=95))]
+                    else:
+                        res = process_single_image_fill(img, settings_opaque, settings_trans, settings_semi, bg_settings, crop_settings)
+                        fmt = output_format.upper(); 
+                        if fmt == 'JPG': bg = Image.new("RGB", res.size, (255,255,255)); bg.paste(res, mask=res.split()[3]); res = bg; fmt = 'JPEG'
+                        out = [(out_fp, encode_image(res, out_fp, format=fmt, quality=95))]
+                def done(fp=fp):
+                    # 寫入成功後才回報完成 (於寫入執行緒呼叫)
+                    if delete_original: remove_source(fp)
+                    log_callback(f"🎨 完成: {fp.name}")
+                writer.submit(out, done)
+                file_progress_callback(100)
+            except Exception as e: log_callback(f"❌ {fp.name}: {e}")
+            prog.advance(fp)
+    _cached_gradient.cache_clear(); _load_material.cache_clear()  # 任務結束即釋放素材快取
+    prog.finish(); progress_callback(100); current_file_callback("Done"); file_progress_callback(100); log_callback("🏁 結束")
 
-def task_scaling(log_callback, progress_callback, current_file_callback, file_progress_callback, input_path, output_path, mode, mode_value_1, recursive, convert_jpg, lower_ext, delete_original, prefix, postfix, crop_doubao, sharpen_factor, brightness_factor, remove_metadata, author, description):
-    log_callback(f"🚀 [Scaling] 開始"); files = get_files(input_path, recursive, file_types='image'); total = len(files); out_base = Path(output_path); out_base.mkdir(parents=True, exist_ok=True)
-    for i, fp in enumerate(files):
-        progress_callback(int((i/total)*100)); current_file_callback(fp.name); file_progress_callback(0)
-        try:
-            dest = out_base / (fp.relative_to(Path(input_path)).parent if Path(input_path).is_dir() else fp.parent.name); dest.mkdir(parents=True, exist_ok=True)
-            new_name = f"{prefix}{fp.stem}{postfix}{'.jpg' if convert_jpg else fp.suffix}"; 
-            if lower_ext: new_name = new_name.lower()
-            with Image.open(fp) as img:
-                if remove_metadata: img.info.clear(); 
-                if 'exif' in img.info: del img.info['exif']
-                if convert_jpg and img.mode in ('RGBA', 'LA', 'P'): img = img.convert('RGB')
-                if crop_doubao: w,h=img.size; sw,sh=w-320,h-110; img = img.crop((0,0,sw,sh)) if sw>0 and sh>0 else img
-                w, h = img.size; nw, nh = w, h
-                if mode == 'ratio' and mode_value_1 != 1: nw, nh = int(w*mode_value_1), int(h*mode_value_1)
-                elif mode == 'width' and mode_value_1 > 0: r = mode_value_1 / w; nw, nh = int(mode_value_1), int(h*r)
-                elif mode == 'height' and mode_value_1 > 0: r = mode_value_1 / h; nh, nw = int(mode_value_1), int(w*r)
-                if (nw, nh) != (w, h): img = img.resize((nw, nh), Image.Resampling.LANCZOS)
-                if sharpen_factor != 1: img = ImageEnhance.Sharpness(img).enhance(sharpen_factor)
-                if brightness_factor != 1: img = ImageEnhance.Brightness(img).enhance(brightness_factor)
-                save_k = {'quality': 95} if new_name.lower().endswith(('.jpg', '.jpeg')) else {}
-                if new_name.lower().endswith('.png') and (author or description):
-                    from PIL.PngImagePlugin import PngInfo; meta = PngInfo()
-                    if author: meta.add_text("Artist", author)
-                    if description: meta.add_text("Description", description)
-                    save_k['pnginfo'] = meta
-                img.save(dest / new_name, **save_k)
-            if delete_original and fp.resolve() != (dest/new_name).resolve(): os.remove(fp)
-            file_progress_callback(100)
-        except Exception as e: log_callback(f"❌ {fp.name}: {e}")
-    progress_callback(100); current_file_callback("Done"); log_callback("🏁 結束")
+def task_scaling(log_callback, progress_callback, current_file_callback, file_progress_callback, input_path, output_path, mode, mode_value_1, recursive, convert_jpg, lower_ext, delete_original, prefix, postfix, crop_doubao, sharpen_factor, brightness_factor, remove_metadata, author, description, files=None):
+    log_callback(f"🚀 [Scaling] 開始"); files = files if files is not None else get_files(input_path, recursive, file_types='image'); prog = WorkProgress('task_scaling', files, progress_callback); out_base = prepare_output(output_path)
+    with AsyncWriter(log_callback=log_callback, output_path=output_path) as writer:
+        for fp, data in prefetch_files(files):
+            current_file_callback(prog.label(fp)); file_progress_callback(0)
+            try:
+                if isinstance(data, Exception): raise data
+                dest = out_base / rel_parent(fp, input_path)
+                new_name = f"{prefix}{fp.stem}{postfix}{'.jpg' if convert_jpg else fp.suffix}"; 
+                if lower_ext: new_name = new_name.lower()
+                with open_image(data) as img:
+                    if remove_metadata: img.info.clear(); 
+                    if 'exif' in img.info: del img.info['exif']
+                    anim = is_animated(img) and Path(new_name).suffix.lower() in ANIMATED_EXTS
+                    frames, durations, loop = read_frames(img) if anim else ([img], None, None)
+                    if convert_jpg and img.mode in ('RGBA', 'LA', 'P'): frames = [f.convert('RGB') for f in frames]
+                    if crop_doubao: w,h=frames[0].size; sw,sh=w-320,h-110; frames = [f.crop((0,0,sw,sh)) for f in frames] if sw>0 and sh>0 else frames
+                    w, h = frames[0].size; nw, nh = w, h
+                    if mode == 'ratio' and mode_value_1 != 1: nw, nh = int(w*mode_value_1), int(h*mode_value_1)
+                    elif mode == 'width' and mode_value_1 > 0: r = mode_value_1 / w; nw, nh = int(mode_value_1), int(h*r)
+                    elif mode == 'height' and mode_value_1 > 0: r = mode_value_1 / h; nh, nw = int(mode_value_1), int(w*r)
+                    if anim: frames = scale_animated_frames(frames, (nw, nh), sharpen_factor, brightness_factor)
+                    else: img = resize_enhance(frames[0], (nw, nh), sharpen_factor, brightness_factor)
+                    save_k = {'quality': 95} if new_name.lower().endswith(('.jpg', '.jpeg')) else {}
+                    if new_name.lower().endswith('.png') and (author or description):
+                        from PIL.PngImagePlugin import PngInfo; meta = PngInfo()
+                        if author: meta.add_text("Artist", author)
+                        if description: meta.add_text("Description", description)
+                        save_k['pnginfo'] = meta
+                    out = [(dest / new_name, encode_animation(frames, durations, loop, new_name, **save_k) if anim else encode_image(img, new_name, **save_k))]
+                writer.submit(out, (lambda fp=fp: remove_source(fp)) if delete_original and fp.resolve() != (dest/new_name).resolve() else None)
+                file_progress_callback(100)
+            except Exception as e: log_callback(f"❌ {fp.name}: {e}")
+            prog.advance(fp)
+    prog.finish(); progress_callback(100); current_file_callback("Done"); log_callback("🏁 結束")
 
-def task_video_sharpen(log_callback, progress_callback, current_file_callback, file_progress_callback, input_path, output_path, recursive, lower_ext, delete_original, prefix, postfix, luma_m_size, luma_amount, scale_mode, scale_value, convert_h264, remove_metadata, author, description):
+def task_video_sharpen(log_callback, progress_callback, current_file_callback, file_progress_callback, input_path, output_path, recursive, lower_ext, delete_original, prefix, postfix, luma_m_size, luma_amount, scale_mode, scale_value, convert_h264, remove_metadata, author, description, encoder_profile='balanced', files=None):
     if not is_ffmpeg_installed(): log_callback("❌ 錯誤：找不到 FFmpeg"); return
-    log_callback(f"🚀 [Video] 開始"); files = get_files(input_path, recursive, file_types='video'); total_dur = sum([max(get_video_duration(f), 1.0) for f in files]); out_base = Path(output_path); out_base.mkdir(parents=True, exist_ok=True); acc_dur = 0.0
+    log_callback(f"🚀 [Video] 開始"); files = files if files is not None else get_files(input_path, recursive, file_types='video'); probes = probe_many(files); total_dur = sum(max(probes[f]['duration'], 1.0) for f in files) or 1.0; out_base = prepare_output(output_path); acc_dur = 0.0
     for fp in files:
         try:
-            current_file_callback(fp.name); rel = fp.relative_to(Path(input_path)) if Path(input_path).is_dir() else fp.name
+            current_file_callback(fp.name); rel = fp.relative_to(Path(input_path)) if Path(input_path).is_dir() else Path(fp.name)
             dest = out_base / rel.parent; dest.mkdir(parents=True, exist_ok=True)
             out_file = dest / f"{prefix}{fp.stem}{postfix}{'.mp4' if convert_h264 else (fp.suffix.lower() if lower_ext else fp.suffix)}"
-            filters = []
-            if luma_amount > 0: filters.append(f"unsharp={luma_m_size}:{luma_m_size}:{luma_amount}")
-            if scale_mode == 'ratio' and scale_value != 1: filters.append(f"scale=iw*{scale_value}:-2")
-            elif scale_mode in ['hd1080', 'hd720']: px = 1080 if scale_mode == 'hd1080' else 720; filters.append(f"scale='if(lt(iw,ih),{px},-2)':'if(lt(iw,ih),-2,{px})'")
-            cmd = ["ffmpeg", "-y", "-i", str(fp)]
+            info = probes[fp]; filters = build_video_filters(info, luma_m_size, luma_amount, scale_mode, scale_value)
+            route, v_args, a_args, s_args = plan_video_encode(info, filters, convert_h264, out_file.suffix, encoder_profile)
+            log_callback(f"{VIDEO_ROUTE_LABELS[route]}: {fp.name}")
+            cmd = ["ffmpeg", "-y"] + (encoder_global_args(encoder_profile) if route == 'encode' else []) + ["-i", str(fp)]
             if filters: cmd.extend(["-vf", ",".join(filters)])
-            if filters or convert_h264: cmd.extend(["-c:v", "libx264", "-crf", "23"])
-            else: cmd.extend(["-c:v", "copy"])
-            cmd.extend(["-c:a", "copy"])
+            cmd.extend(v_args + a_args + s_args)
             if remove_metadata: cmd.extend(["-map_metadata", "-1"])
             if author: cmd.extend(["-metadata", f"artist={author}"])
             if description: cmd.extend(["-metadata", f"description={description}"])
             cmd.append(str(out_file))
-            subprocess.Popen(cmd, stderr=subprocess.PIPE).wait()
-            if delete_original and fp.resolve() != out_file.resolve(): os.remove(fp)
-            acc_dur += max(get_video_duration(fp), 1); progress_callback(int((acc_dur/total_dur)*100)); file_progress_callback(100)
+            r = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, errors='replace')
+            if r.returncode != 0 or not out_file.exists() or out_file.stat().st_size == 0:
+                # 失敗時保留原檔，並清掉不完整的輸出
+                if out_file.exists() and fp.resolve() != out_file.resolve(): out_file.unlink()
+                log_callback(f"❌ {fp.name}: {r.stderr.strip().splitlines()[-1] if r.stderr.strip() else f'ffmpeg 失敗 (code {r.returncode})'}")
+            elif delete_original and fp.resolve() != out_file.resolve(): os.remove(fp)
+            acc_dur += max(probes[fp]['duration'], 1); progress_callback(int((acc_dur/total_dur)*100)); file_progress_callback(100)
         except Exception as e: log_callback(f"❌ {fp.name}: {e}")
     log_callback("🏁 結束")
 
-def task_rename_replace(log_callback, progress_callback, current_file_callback, file_progress_callback, input_path, recursive, do_prefix, old_prefix, new_prefix, do_suffix, old_suffix, new_suffix, remove_metadata, author, description):
-    log_callback("🚀 [Rename] 開始"); files = get_files(input_path, recursive, file_types='all'); total = len(files)
+def task_video_benchmark(log_callback, progress_callback, current_file_callback, file_progress_callback, input_path, recursive, luma_m_size, luma_amount, scale_mode, scale_value, profiles=None, sample_seconds=10):
+    # 用第一支影片的前 N 秒依序以各設定檔編碼，回報 fps / 速度倍數 / 輸出大小
+    if not is_ffmpeg_installed(): log_callback("❌ 錯誤：找不到 FFmpeg"); return []
+    files = get_files(input_path, recursive, file_types='video')
+    if not files: log_callback("❌ 找不到可測試的影片"); return []
+    fp = files[0]; info = probe_many([fp])[fp]; profiles = list(profiles or ENCODER_PROFILES)
+    clip = min(info['duration'], sample_seconds) or sample_seconds; frames = clip * info['fps']
+    filters = build_video_filters(info, luma_m_size, luma_amount, scale_mode, scale_value); results = []
+    log_callback(f"⏱️ [Benchmark] {fp.name} 前 {clip:.1f}s ({info['width']}x{info['height']} {info['vcodec']})")
+    with tempfile.TemporaryDirectory() as tmp:
+        for i, name in enumerate(profiles):
+            progress_callback(int((i/len(profiles))*100)); current_file_callback(f"{fp.name} · {name}")
+            out = Path(tmp) / f"{name}.mp4"
+            cmd = ["ffmpeg", "-y"] + encoder_global_args(name) + ["-t", str(clip), "-i", str(fp)]
+            if filters: cmd.extend(["-vf", ",".join(filters)])
+            cmd.extend(encoder_args(name) + ["-an", str(out)])
+            t0 = time.perf_counter(); r = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True); el = time.perf_counter() - t0
+            if r.returncode != 0 or not out.exists(): log_callback(f"❌ {name}: {r.stderr.strip().splitlines()[-1] if r.stderr.strip() else 'ffmpeg 失敗'}"); continue
+            res = {'profile': name, 'seconds': el, 'fps': frames / el if el else 0.0, 'speed': clip / el if el else 0.0, 'bytes': out.stat().st_size}
+            results.append(res); log_callback(f"📊 {name:<9} {res['fps']:7.1f} fps  {res['speed']:5.2f}x  {res['bytes']/1024/1024:7.2f} MB")
+    progress_callback(100); current_file_callback("Done"); log_callback("🏁 結束")
+    return results
+
+def task_rename_replace(log_callback, progress_callback, current_file_callback, file_progress_callback, input_path, recursive, do_prefix, old_prefix, new_prefix, do_suffix, old_suffix, new_suffix, remove_metadata, author, description, files=None):
+    log_callback("🚀 [Rename] 開始"); files = files if files is not None else get_files(input_path, recursive, file_types='all'); total = len(files)
     for i, fp in enumerate(files):
         progress_callback(int((i/total)*100)); current_file_callback(fp.name); file_progress_callback(0)
         try:
@@ -250,18 +479,22 @@ def task_rename_replace(log_callback, progress_callback, current_file_callback,
         except Exception as e: log_callback(f"❌ {fp.name}: {e}")
     progress_callback(100); current_file_callback("Done"); file_progress_callback(100); log_callback("🏁 結束")
 
-def task_multi_res(log_callback, progress_callback, current_file_callback, file_progress_callback, input_path, output_path, recursive, lower_ext, orientation, target_sizes):
-    log_callback(f"🚀 [Icon] 開始 (Sizes: {target_sizes})"); files = get_files(input_path, recursive, file_types='image'); out_base = Path(output_path)
-    for i, fp in enumerate(files):
-        progress_callback(int((i/len(files))*100)); current_file_callback(fp.name)
-        try:
-            with Image.open(fp) as img:
-                w, h = img.size; ref = w if orientation == 'h' else h
-                dest = out_base / (fp.relative_to(Path(input_path)).parent if Path(input_path).is_dir() else fp.parent.name); dest.mkdir(parents=True, exist_ok=True)
-                for s in target_sizes:
-                    if ref >= s:
-                        nw, nh = (s, int(h * (s/w))) if orientation == 'h' else (int(w * (s/h)), s)
-                        img.resize((nw, nh), Image.Resampling.LANCZOS).save(dest / f"{fp.stem}-{s}{fp.suffix}", quality=90)
-            file_progress_callback(100)
-        except: pass
-    progress_callback(100); log_callback("🏁 結束")
\ No newline at end of file
+def task_multi_res(log_callback, progress_callback, current_file_callback, file_progress_callback, input_path, output_path, recursive, lower_ext, orientation, target_sizes, files=None):
+    log_callback(f"🚀 [Icon] 開始 (Sizes: {target_sizes})"); files = files if files is not None else get_files(input_path, recursive, file_types='image'); prog = WorkProgress('task_multi_res', files, progress_callback); out_base = Path(output_path)
+    with AsyncWriter(log_callback=log_callback, output_path=output_path) as writer:
+        for fp, data in prefetch_files(files):
+            current_file_callback(prog.label(fp))
+            try:
+                if isinstance(data, Exception): raise data
+                with open_image(data) as img:
+                    w, h = img.size; ref = w if orientation == 'h' else h; out = []
+                    dest = out_base / rel_parent(fp, input_path)
+                    for s in target_sizes:
+                        if ref >= s:
+                            nw, nh = (s, int(h * (s/w))) if orientation == 'h' else (int(w * (s/h)), s)
+                            out_fp = dest / f"{fp.stem}-{s}{fp.suffix}"; out.append((out_fp, encode_image(img.resize((nw, nh), Image.Resampling.LANCZOS), out_fp, quality=90)))
+                writer.submit(out)
+                file_progress_callback(100)
+            except: pass
+            prog.advance(fp)
+    prog.finish(); progress_callback(100); log_callback("🏁 結束")
\ No newline at end of file
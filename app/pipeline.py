@@ -0,0 +1,109 @@
+import io
+import time
+import queue
+import tarfile
+import zipfile
+import threading
+from pathlib import Path
+from PIL import Image
+from app.utils import is_archive
+
+# -----------------------------------------------------------------------------
+# 分段管線：預讀 (讀檔) -> 處理 (呼叫端迴圈) -> 非同步寫入
+# 各段之間以有界佇列連接，磁碟/網路延遲被運算時間遮蔽，同時限制記憶體用量
+# -----------------------------------------------------------------------------
+_DONE = object()
+
+def prefetch_files(files, depth=4):
+    # 背景執行緒依序讀入檔案內容；產出 (path, bytes)，讀取失敗時第二項為例外物件
+    q = queue.Queue(maxsize=max(1, depth)); stop = threading.Event()
+
+    def reader():
+        for fp in files:
+            if stop.is_set(): break
+            try: item = (fp, fp.read_bytes())
+            except Exception as e: item = (fp, e)
+            while not stop.is_set():
+                try: q.put(item, timeout=0.2); break
+                except queue.Full: pass
+        q.put(_DONE)
+
+    t = threading.Thread(target=reader, daemon=True); t.start()
+    try:
+        while (item := q.get()) is not _DONE: yield item
+    finally:
+        # 呼叫端提早結束時通知讀取執行緒停止，並清空佇列讓它能放入結束標記
+        stop.set()
+        while t.is_alive():
+            try: q.get(timeout=0.1)
+            except queue.Empty: pass
+
+def open_image(data):
+    return Image.open(io.BytesIO(data))
+
+def encode_image(img, path, **save_k):
+    # 在記憶體中依副檔名編碼，交給 AsyncWriter 落地
+    buf = io.BytesIO(); fmt = save_k.pop('format', None) or Image.registered_extensions().get(Path(path).suffix.lower())
+    img.save(buf, format=fmt, **save_k); return buf.getvalue()
+
+def encode_animation(frames, durations, loop, path, **save_k):
+    # 動畫輸出：每格皆為完整畫面，GIF 用「還原背景」、APNG 用整格取代，避免透明區殘影
+    fmt = save_k.pop('format', None) or Image.registered_extensions().get(Path(path).suffix.lower())
+    extra = {'disposal': 2} if fmt == 'GIF' else {'disposal': 0, 'blend': 0} if fmt == 'PNG' else {}
+    if loop is not None: extra['loop'] = loop  # 不傳 loop 才能保留「只播一次」
+    buf = io.BytesIO()
+    frames[0].save(buf, format=fmt, save_all=True, append_images=frames[1:], duration=durations, **extra, **save_k)
+    return buf.getvalue()
+
+# 已壓縮的格式寫入 ZIP 時只儲存不壓縮，省下無效的 deflate 時間
+STORE_ONLY_EXTS = {'.jpg', '.jpeg', '.png', '.webp', '.gif', '.heic', '.heif', '.mp4', '.mov', '.webm', '.zip', '.gz'}
+
+class ArchiveWriter:
+    def __init__(self, path):
+        self.path = Path(path); name = self.path.name.lower()
+        if name.endswith('.zip'): self.zf = zipfile.ZipFile(self.path, 'w', zipfile.ZIP_DEFLATED, allowZip64=True); self.tf = None
+        else:
+            mode = 'w:gz' if name.endswith(('.tar.gz', '.tgz')) else 'w:bz2' if name.endswith(('.tar.bz2', '.tbz2')) else 'w:xz' if name.endswith(('.tar.xz', '.txz')) else 'w'
+            self.tf = tarfile.open(self.path, mode); self.zf = None
+
+    def write(self, arcname, data):
+        if self.zf:
+            info = zipfile.ZipInfo(arcname, time.localtime()[:6])
+            info.compress_type = zipfile.ZIP_STORED if Path(arcname).suffix.lower() in STORE_ONLY_EXTS else zipfile.ZIP_DEFLATED
+            self.zf.writestr(info, data)
+        else:
+            info = tarfile.TarInfo(arcname); info.size = len(data); info.mtime = time.time(); self.tf.addfile(info, io.BytesIO(data))
+
+    def close(self): (self.zf or self.tf).close()
+
+class AsyncWriter:
+    def __init__(self, depth=8, log_callback=None, output_path=None):
+        # output_path 為封存檔時，結果直接寫進該封存 (成員路徑 = 相對 output_path 的路徑)
+        self.q = queue.Queue(maxsize=max(1, depth)); self.log_callback = log_callback
+        self.archive = ArchiveWriter(output_path) if output_path and is_archive(output_path) else None
+        self.t = threading.Thread(target=self._run, daemon=True); self.t.start()
+
+    def _put(self, path, data):
+        path = Path(path)
+        if self.archive: self.archive.write(path.relative_to(self.archive.path).as_posix(), data); return
+        path.parent.mkdir(parents=True, exist_ok=True); path.write_bytes(data)
+
+    def _run(self):
+        while (item := self.q.get()) is not _DONE:
+            outputs, then = item
+            try:
+                for path, data in outputs: self._put(path, data)
+                if then: then()
+            except Exception as e:
+                if self.log_callback: self.log_callback(f"❌ 寫入失敗 {Path(outputs[0][0]).name if outputs else ''}: {e}")
+
+    def submit(self, outputs, then=None):
+        # outputs: [(目的路徑, bytes)]；then 在全部寫入成功後於寫入執行緒呼叫 (例如刪除原檔)
+        self.q.put((list(outputs), then))
+
+    def close(self):
+        self.q.put(_DONE); self.t.join()
+        if self.archive: self.archive.close()
+
+    def __enter__(self): return self
+    def __exit__(self, *exc): self.close()
@@ -3,9 +3,10 @@ from PySide6.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
                                QStackedWidget, QLineEdit, QCheckBox, QGroupBox, 
                                QFormLayout, QComboBox, QSplitter, QScrollArea, QFrame, 
                                QProgressBar, QColorDialog, QDialog, QSpinBox, QDoubleSpinBox, QGridLayout, QSlider, QMessageBox)
-from PySide6.QtCore import Qt, QSettings, Signal
-from PySide6.QtGui import QDragEnterEvent, QDropEvent, QTextCursor
-from app.workers import Worker
+from PySide6.QtCore import Qt, QSettings, Signal, QTimer
+from PySide6.QtGui import QDragEnterEvent, QDropEvent, QTextCursor, QPixmap
+from app.workers import Worker, PreviewWorker, WatchWorker
+from app.estimate import task_preflight
 import app.logic as logic
 from pathlib import Path
 
@@ -90,6 +91,7 @@ class ImageEditorDialog(QDialog):
     def load_img_path(self, f): self.path=f; self.preview.setText(f"已載入: {Path(f).name}")
 
 class RegionControl(QGroupBox):
+    changed = Signal()
     def __init__(self, title, has_target_select=False, parent=None):
         super().__init__(title, parent); self.has_target = has_target_select
         self.sets = {'target_color':'#FFFFFF', 'fill_color':'#FFFFFF', 'fill_gradient':{}, 'fill_image_path':''}
@@ -115,10 +117,13 @@ class RegionControl(QGroupBox):
         lgs.addWidget(bgs); lgs.addWidget(self.edt_gs); lgs.addWidget(bge); lgs.addWidget(self.edt_ge); lg.addLayout(lgs); self.st_c.addWidget(pg)
         pi = QWidget(); li = QVBoxLayout(pi); btn_img = QPushButton("選擇圖片"); btn_img.clicked.connect(self.pk_img); li.addWidget(btn_img); self.st_c.addWidget(pi)
         l.addWidget(self.st_c); l.addStretch()
+        for cb in ([self.cb_t] if self.has_target else []) + [self.cb_tr, self.cb_c]: cb.currentIndexChanged.connect(lambda *_: self.changed.emit())
+        for e in ([self.edt_tc] if self.has_target else []) + [self.edt_fc, self.edt_gs, self.edt_ge]: e.textChanged.connect(lambda *_: self.changed.emit())
+        for sl in (self.sl_tr, self.sl_ga): sl.valueChanged.connect(lambda *_: self.changed.emit())
     def pick(self, edt): (c:=QColorDialog.getColor()) and c.isValid() and edt.setText(c.name().upper())
-    def pk_img(self): (f:=QFileDialog.getOpenFileName(self,"選圖")[0]) and self.sets.__setitem__('fill_image_path',f)
+    def pk_img(self): (f:=QFileDialog.getOpenFileName(self,"選圖")[0]) and (self.sets.__setitem__('fill_image_path',f), self.changed.emit())
     def get_settings(self):
-        return {'target_mode': ['all','specific','non_specific'][self.cb_t.currentIndex()] if self.has_target else 'all', 'target_color': self.edt_tc.text(), 
+        return {'target_mode': ['all','specific','non_specific'][self.cb_t.currentIndex()] if self.has_target else 'all', 'target_color': self.edt_tc.text() if self.has_target else '#FFFFFF', 
                 'trans_mode': 'change' if self.cb_tr.currentIndex()==1 else 'maintain', 'trans_val': self.sl_tr.value(), 
                 'fill_mode': ['maintain','color','gradient','image'][self.cb_c.currentIndex()], 'fill_color': self.edt_fc.text(), 
                 'fill_gradient': {'start':self.edt_gs.text(), 'end':self.edt_ge.text(), 'angle':self.sl_ga.value()}, 'fill_image_path': self.sets['fill_image_path']}
@@ -156,14 +161,19 @@ class MainWindow(QMainWindow):
         self.stack.setCurrentIndex(idx); [b.set_selected(b.index==idx) for b in self.btns]
         self.header.setText(["修改檔名","圖片處理","智慧填色","影片銳利化","Icon 生成"][idx])
 
-    def _create_scroll(self, click_func):
+    def _create_scroll(self, click_func, watchable=True, estimate_func=None):
         wrapper = QWidget(); wl = QVBoxLayout(wrapper); wl.setContentsMargins(0,0,0,0)
         sc = QScrollArea(); sc.setWidgetResizable(True); sc.setFrameShape(QFrame.NoFrame); ct = QWidget(); ct.setObjectName("ScrollContent")
         self.cl = QVBoxLayout(ct); self.cl.setContentsMargins(40,30,40,30); self.cl.setSpacing(20); sc.setWidget(ct); wl.addWidget(sc, 1)
         bot = QWidget(); bot.setObjectName("BotContainer"); bl = QHBoxLayout(bot); bl.setContentsMargins(40,15,40,15)
         btn = QPushButton("開始執行"); btn.setObjectName("ExecBtn"); btn.setCursor(Qt.PointingHandCursor); btn.clicked.connect(click_func)
         pb = QProgressBar(); pb.setObjectName("TotalProgress"); pb.setRange(0,100)
-        bl.addWidget(btn); bl.addSpacing(20); bl.addWidget(SelectableLabel("總進度:")); bl.addWidget(pb); wl.addWidget(bot)
+        bl.addWidget(btn); bl.addSpacing(20)
+        if estimate_func: be = QPushButton("預估時間"); be.setToolTip("只讀取圖檔標頭，統計像素量並依實測吞吐量估算耗時"); be.clicked.connect(estimate_func); bl.addWidget(be); bl.addSpacing(20)
+        # 監看模式：勾選後「開始執行」改為常駐監看輸入資料夾，再按一次停止
+        pb.watch_ck = None
+        if watchable: pb.watch_ck = QCheckBox("監看模式"); pb.watch_ck.setToolTip("持續監看輸入資料夾，新檔案複製完成後自動處理"); bl.addWidget(pb.watch_ck); bl.addSpacing(20)
+        bl.addWidget(SelectableLabel("總進度:")); bl.addWidget(pb); wl.addWidget(bot)
         return wrapper, self.cl, pb
 
     def create_path_group(self, with_output=True):
@@ -184,7 +194,7 @@ class MainWindow(QMainWindow):
 
     # ------------------ Pages ------------------
     def page_rename_ui(self):
-        p, l, self.rn_pb = self._create_scroll(self.run_rename); gp, self.rn_i, _ = self.create_path_group(False); l.addWidget(gp)
+        p, l, self.rn_pb = self._create_scroll(self.run_rename, watchable=False); gp, self.rn_i, _ = self.create_path_group(False); l.addWidget(gp)
         gr = QGroupBox("規則"); lr = QFormLayout(gr)
         self.ck_rp = QCheckBox("改前綴"); self.p1 = QLineEdit(); self.p1.setPlaceholderText("舊前綴"); self.p2 = QLineEdit(); self.p2.setPlaceholderText("新前綴")
         rp = QHBoxLayout(); rp.addWidget(self.p1); rp.addWidget(SelectableLabel("->")); rp.addWidget(self.p2)
@@ -203,7 +213,7 @@ class MainWindow(QMainWindow):
                         remove_metadata=self.rn_rm.isChecked(), author=self.rn_au.text(), description=self.rn_de.text())
 
     def page_scaling_ui(self):
-        p,l,self.sc_pb = self._create_scroll(self.run_scaling); gp, self.sc_i, self.sc_o = self.create_path_group(); l.addWidget(gp)
+        p,l,self.sc_pb = self._create_scroll(self.run_scaling, estimate_func=lambda: self.run_preflight('task_scaling', self.sc_i, self.sc_rec, self.sc_pb)); gp, self.sc_i, self.sc_o = self.create_path_group(); l.addWidget(gp)
         go = QGroupBox("參數"); lo = QFormLayout(go); self.sc_mode = WhiteComboBox(); self.sc_mode.addItems(["維持", "Ratio", "Fixed Width", "Fixed Height"])
         self.sc_v1 = QLineEdit("1.0"); lo.addRow(SelectableLabel("模式:"), self.sc_mode); lo.addRow(SelectableLabel("數值:"), self.sc_v1)
         self.sc_sh = SliderInput(0, 5, 0.1, 1.0); lo.addRow(SelectableLabel("銳利度:"), self.sc_sh)
@@ -225,7 +235,7 @@ class MainWindow(QMainWindow):
                         remove_metadata=self.sc_meta.isChecked(), author=self.sc_au.text(), description=self.sc_de.text())
 
     def page_fill_ui(self):
-        p,l,self.fill_pb = self._create_scroll(self.run_fill); gp, self.fi, self.fo = self.create_path_group(); l.addWidget(gp)
+        p,l,self.fill_pb = self._create_scroll(self.run_fill, estimate_func=lambda: self.run_preflight('task_image_fill', self.fi, self.fill_rec, self.fill_pb)); gp, self.fi, self.fo = self.create_path_group(); l.addWidget(gp)
         rr = QHBoxLayout(); self.rop = RegionControl("不透明區塊", True); self.rtr = RegionControl("透明區塊"); self.rse = RegionControl("半透明區塊", True)
         rr.addWidget(self.rop); rr.addWidget(self.rtr); rr.addWidget(self.rse); l.insertLayout(1, rr)
         adv = QHBoxLayout(); gb = QGroupBox("背景設定"); lb = QFormLayout(gb)
@@ -239,18 +249,46 @@ class MainWindow(QMainWindow):
         self.cb_shp.addItems(["圓形","正方形","正三角形","正五邊形","正六邊形","四角星形(圓角)","四角星形(尖角)","五角星形(圓角)","五角星形(尖角)","隨機雲狀(正圓內)","隨機雲狀"]); self.ck_trim = QCheckBox("貼合尺寸裁切"); self.ck_trim.setObjectName("PinkCheck")
         lc.addWidget(self.ck_shp); lc.addWidget(self.cb_shp); lc.addWidget(self.ck_trim); lc.addStretch(); adv.addWidget(gc, 1); l.insertLayout(2, adv)
         out_row = QHBoxLayout(); gout = QGroupBox("輸出設定"); lout = QVBoxLayout(gout); self.fi_fmt = WhiteComboBox(); self.fi_fmt.addItems(["png","jpg"]); lout.addWidget(SelectableLabel("格式:")); lout.addWidget(self.fi_fmt)
-        self.fill_rec = QCheckBox("含子資料夾"); lout.addWidget(self.fill_rec); self.fill_del = QCheckBox("刪除原始"); lout.addWidget(self.fill_del); out_row.addWidget(gout, 1); prev = QLabel("預覽區塊"); prev.setAlignment(Qt.AlignCenter); prev.setStyleSheet("border:2px dashed #999;background:#eee;min-height:100px;"); out_row.addWidget(prev, 1); l.insertLayout(3, out_row); return p
+        self.fill_rec = QCheckBox("含子資料夾"); lout.addWidget(self.fill_rec); self.fill_del = QCheckBox("刪除原始"); lout.addWidget(self.fill_del); out_row.addWidget(gout, 1)
+        self.fill_prev = QLabel("預覽區塊"); self.fill_prev.setAlignment(Qt.AlignCenter); self.fill_prev.setStyleSheet("border:2px dashed #999;background:#eee;min-height:240px;"); out_row.addWidget(self.fill_prev, 1); l.insertLayout(3, out_row)
+        # 即時預覽：設定變動後去抖動 60ms 再送出，背景執行緒只渲染最新一筆；輸入路徑打字時去抖動 400ms
+        self.fill_src = None; self.fill_src_timer = QTimer(self); self.fill_src_timer.setSingleShot(True); self.fill_src_timer.setInterval(400); self.fill_src_timer.timeout.connect(self.on_fill_input_change)
+        self.fill_timer = QTimer(self); self.fill_timer.setSingleShot(True); self.fill_timer.setInterval(60); self.fill_timer.timeout.connect(self.render_fill_preview)
+        self.fill_preview = PreviewWorker(); self.fill_preview.result_signal.connect(self.on_fill_preview); self.fill_preview.error_signal.connect(lambda e: self.fill_prev.setText(f"預覽失敗: {e}"))
+        self.fill_preview.empty_signal.connect(self.clear_fill_preview); self.fill_preview.start()
+        self.fi.textChanged.connect(self.fill_src_timer.start); self.fill_rec.toggled.connect(self.on_fill_input_change)
+        for r in (self.rop, self.rtr, self.rse): r.changed.connect(self.queue_fill_preview)
+        for cb in (self.bg_mode, self.bg_mat, self.bg_cut, self.cb_shp): cb.currentIndexChanged.connect(self.queue_fill_preview)
+        for e in (self.bg_c, self.bg_gs, self.bg_ge, self.bg_cc): e.textChanged.connect(self.queue_fill_preview)
+        self.bg_ga.valueChanged.connect(self.queue_fill_preview); self.ck_shp.toggled.connect(self.queue_fill_preview); self.ck_trim.toggled.connect(self.queue_fill_preview)
+        return p
 
-    def set_bg_img(self): (d:=ImageEditorDialog(self)) and d.exec() and self.bg_sets.__setitem__('image_path',d.path)
+    def set_bg_img(self): (d:=ImageEditorDialog(self)) and d.exec() and (self.bg_sets.__setitem__('image_path',d.path), self.queue_fill_preview())
     def pick(self, e): (c:=QColorDialog.getColor()) and c.isValid() and e.setText(c.name())
-    def run_fill(self):
+    def fill_settings(self):
         bg = {'enabled':True, 'mode':['overlay','cutout'][self.bg_mode.currentIndex()], 'material_type':['color','gradient','image'][self.bg_mat.currentIndex()],
               'color':self.bg_c.text(), 'gradient':{'start':self.bg_gs.text(),'end':self.bg_ge.text(),'angle':self.bg_ga.value()},
               'image_path':self.bg_sets.get('image_path',''), 'cutout_target':['opaque','transparent','color'][self.bg_cut.currentIndex()], 'cutout_color':self.bg_cc.text()}
         crop = {'shape':self.cb_shp.currentText() if self.ck_shp.isChecked() else '無', 'trim':self.ck_trim.isChecked()}
+        return {'settings_opaque':self.rop.get_settings(), 'settings_trans':self.rtr.get_settings(), 'settings_semi':self.rse.get_settings(), 'bg_settings':bg, 'crop_settings':crop}
+    def run_fill(self):
         self.run_worker(logic.task_image_fill, self.fill_pb, input_path=self.fi.text(), output_path=self.fo.text(), recursive=self.fill_rec.isChecked(),
-                        settings_opaque=self.rop.get_settings(), settings_trans=self.rtr.get_settings(), settings_semi=self.rse.get_settings(),
-                        bg_settings=bg, crop_settings=crop, delete_original=self.fill_del.isChecked(), output_format=self.fi_fmt.currentText())
+                        delete_original=self.fill_del.isChecked(), output_format=self.fi_fmt.currentText(), **self.fill_settings())
+    def on_fill_input_change(self, *_):
+        # 路徑存在才交給預覽執行緒找樣本 (找到第一張即停)，介面執行緒不掃描目錄
+        self.fill_src_timer.stop(); txt = self.fi.text()
+        self.fill_src = (txt, self.fill_rec.isChecked()) if txt and Path(txt).exists() else None
+        if self.fill_src: self.queue_fill_preview()
+        else: self.clear_fill_preview()
+    def clear_fill_preview(self): self.fill_prev.clear(); self.fill_prev.setToolTip(""); self.fill_prev.setText("預覽區塊")
+    def queue_fill_preview(self, *_): self.fill_timer.start()
+    def render_fill_preview(self):
+        if not self.fill_src: return
+        fs = self.fill_settings()
+        self.fill_preview.request(self.fill_src, (fs['settings_opaque'], fs['settings_trans'], fs['settings_semi'], fs['bg_settings'], fs['crop_settings']))
+    def on_fill_preview(self, qimg, ms, name):
+        pm = QPixmap.fromImage(qimg).scaled(self.fill_prev.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        self.fill_prev.setPixmap(pm); self.fill_prev.setToolTip(f"{name} · {qimg.width()}x{qimg.height()} · {ms:.0f} ms")
 
     def page_video_ui(self):
         p,l,self.vd_pb = self._create_scroll(self.run_video); gp, self.vi, self.vo = self.create_path_group(); l.addWidget(gp)
@@ -258,23 +296,32 @@ class MainWindow(QMainWindow):
         self.vd_la = SliderInput(0, 5, 0.1, 1.0); ls.addRow(SelectableLabel("Luma Amount:"), self.vd_la); self.vd_pre = QLineEdit(); self.vd_post = QLineEdit()
         ls.addRow(SelectableLabel("前綴:"), self.vd_pre); ls.addRow(SelectableLabel("後綴:"), self.vd_post); l.addWidget(gs)
         gr = QGroupBox("輸出"); lr = QFormLayout(gr); self.vd_sm = WhiteComboBox(); self.vd_sm.addItems(["None","1080p","720p","Ratio"]); self.vd_sv = SliderInput(0.1, 5.0, 0.1, 1.0)
-        lr.addRow(SelectableLabel("縮放模式:"), self.vd_sm); lr.addRow(SelectableLabel("比例 (Ratio):"), self.vd_sv); l.addWidget(gr)
+        lr.addRow(SelectableLabel("縮放模式:"), self.vd_sm); lr.addRow(SelectableLabel("比例 (Ratio):"), self.vd_sv)
+        self.vd_prof = WhiteComboBox(); self.vd_prof.addItems([v['label'] for v in logic.ENCODER_PROFILES.values()]); self.vd_prof.setCurrentIndex(list(logic.ENCODER_PROFILES).index(self.settings.value("vd_prof", "balanced")) if self.settings.value("vd_prof", "balanced") in logic.ENCODER_PROFILES else 0)
+        btn_bm = QPushButton("效能測試"); btn_bm.setToolTip("以第一支影片的前 10 秒測試各設定檔的編碼速度與大小"); btn_bm.clicked.connect(self.run_video_benchmark)
+        rp = QHBoxLayout(); rp.addWidget(self.vd_prof, 1); rp.addWidget(btn_bm); lr.addRow(SelectableLabel("編碼設定檔:"), rp); l.addWidget(gr)
         gc = QGroupBox("選項"); lc = QGridLayout(gc); self.vd_rec = QCheckBox("含子資料夾"); self.vd_rec.setChecked(True); self.vd_mp4 = QCheckBox("轉MP4"); self.vd_mp4.setChecked(True)
         self.vd_low = QCheckBox("小寫"); self.vd_low.setChecked(True); self.vd_del = QCheckBox("刪除原始"); self.vd_meta = QCheckBox("移除 Meta(隱藏資訊)"); self.vd_au = QLineEdit(self.settings.value("vd_au","")); self.vd_de = QLineEdit()
         lc.addWidget(self.vd_rec,0,0); lc.addWidget(self.vd_mp4,0,1); lc.addWidget(self.vd_low,0,2); lc.addWidget(self.vd_del,1,0); lc.addWidget(self.vd_meta,1,1)
         lr.addRow(SelectableLabel("作者:"), self.vd_au); lr.addRow(SelectableLabel("描述:"), self.vd_de); l.addWidget(gc); l.addStretch(); return p
     
+    def run_video_benchmark(self):
+        self.run_worker(logic.task_video_benchmark, self.vd_pb, allow_watch=False, input_path=self.vi.text(), recursive=self.vd_rec.isChecked(), luma_m_size=int(self.vd_ls.value()),
+                        luma_amount=self.vd_la.value(), scale_mode=['none','hd1080','hd720','ratio'][self.vd_sm.currentIndex()], scale_value=self.vd_sv.value())
+
     def run_video(self):
         self.settings.setValue("vd_au", self.vd_au.text())
+        prof = list(logic.ENCODER_PROFILES)[self.vd_prof.currentIndex()]; self.settings.setValue("vd_prof", prof)
         sm = ['none','hd1080','hd720','ratio'][self.vd_sm.currentIndex()]
         self.run_worker(logic.task_video_sharpen, self.vd_pb, input_path=self.vi.text(), output_path=self.vo.text(), recursive=self.vd_rec.isChecked(),
                         lower_ext=self.vd_low.isChecked(), delete_original=self.vd_del.isChecked(), prefix=self.vd_pre.text(), postfix=self.vd_post.text(),
                         luma_m_size=int(self.vd_ls.value()), luma_amount=self.vd_la.value(), scale_mode=sm, scale_value=self.vd_sv.value(),
-                        convert_h264=self.vd_mp4.isChecked(), remove_metadata=self.vd_meta.isChecked(), author=self.vd_au.text(), description=self.vd_de.text())
+                        convert_h264=self.vd_mp4.isChecked(), remove_metadata=self.vd_meta.isChecked(), author=self.vd_au.text(), description=self.vd_de.text(),
+                        encoder_profile=prof)
 
     # [Icon 修正]
     def page_multi_ui(self):
-        p,l,self.mt_pb = self._create_scroll(self.run_multi)
+        p,l,self.mt_pb = self._create_scroll(self.run_multi, estimate_func=lambda: self.run_preflight('task_multi_res', self.mi, self.mt_rec, self.mt_pb))
         gp, self.mi, self.mo = self.create_path_group(); l.addWidget(gp)
         opt = QGroupBox("設定"); lo = QFormLayout(opt)
         self.mt_ori = WhiteComboBox(); self.mt_ori.setMinimumWidth(200); self.mt_ori.addItems(["水平 (寬度基準)", "垂直 (高度基準)"])
@@ -312,9 +359,30 @@ class MainWindow(QMainWindow):
                         recursive=self.mt_rec.isChecked(), lower_ext=True, orientation='h' if self.mt_ori.currentIndex()==0 else 'v',
                         target_sizes=target_sizes)
 
-    def run_worker(self, func, pb, **kwargs):
+    def closeEvent(self, e):
+        self.fill_preview.stop()
+        if isinstance(getattr(self, 'worker', None), WatchWorker) and self.worker.isRunning(): self.worker.requestInterruption(); self.worker.wait()
+        super().closeEvent(e)
+
+    def on_watch_stats(self, s):
+        self.lbl_cur.setText(f"監看中 · 佇列 {s['queue']} · 等待穩定 {s['pending']} · 完成 {s['processed']} / 失敗 {s['failed']} · 平均延遲 {s['avg_latency']:.1f}s · P95 {s['p95_latency']:.1f}s")
+
+    def run_preflight(self, task_name, edt_in, ck_rec, pb):
+        self.run_worker(task_preflight, pb, allow_watch=False, input_path=edt_in.text(), recursive=ck_rec.isChecked(), task_name=task_name)
+
+    def run_worker(self, func, pb, allow_watch=True, **kwargs):
+        if isinstance(getattr(self, 'worker', None), WatchWorker) and self.worker.isRunning():
+            # 只有啟動監看的那一頁的「開始執行」能停止監看；其他按鈕 (預估時間、效能測試、別頁) 一律拒絕
+            if allow_watch and pb is self.active_pb: self.worker.requestInterruption(); self.log("⏹️ 停止監看中...")
+            else: self.log("⚠️ 監看模式執行中，請先停止監看")
+            return
         if not kwargs.get('input_path'): self.log("❌ 路徑未設定"); return
-        self.active_pb = pb; self.worker = Worker(func, **kwargs)
+        self.active_pb = pb
+        if allow_watch and pb.watch_ck and pb.watch_ck.isChecked():
+            if not Path(kwargs['input_path']).is_dir(): self.log("❌ 監看模式需要輸入資料夾"); return
+            self.worker = WatchWorker(func, file_types='video' if func is logic.task_video_sharpen else 'image', **kwargs)
+            self.worker.stats_signal.connect(self.on_watch_stats)
+        else: self.worker = Worker(func, **kwargs)
         self.worker.log_signal.connect(self.log)
         self.worker.progress_signal.connect(pb.setValue)
         self.worker.current_file_signal.connect(lambda s: self.lbl_cur.setText(f"處理中: {s}"))
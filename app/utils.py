@@ -2,17 +2,113 @@ import sys
 import os
 import shutil
 import subprocess
-from pathlib import Path
+import json
+import uuid
+import threading
+import zipfile
+import tarfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path, PurePosixPath
 
-# 支援的圖片格式 (加入 HEIC/HEIF)
-VALID_IMG_EXTS = {'.jpg', '.jpeg', '.png', '.bmp', '.webp', '.tiff', '.heic', '.heif'}
+# 支援的圖片格式 (加入 HEIC/HEIF、GIF 動圖)
+VALID_IMG_EXTS = {'.jpg', '.jpeg', '.png', '.bmp', '.webp', '.tiff', '.heic', '.heif', '.gif'}
 # 支援的影片格式
 VALID_VIDEO_EXTS = {'.mp4', '.mov', '.avi', '.mkv', '.webm', '.flv'}
+# 可直接讀寫的封存格式 (圖片任務)
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+
+def is_archive(path):
+    return str(path).lower().endswith(ARCHIVE_SUFFIXES)
+
+# -----------------------------------------------------------------------------
+# 封存檔成員：不解壓，以類 Path 物件交給任務迴圈，內容從記憶體串流
+# -----------------------------------------------------------------------------
+_archive_handles = threading.local()
+
+def _archive_sig(archive):
+    st = os.stat(archive); return st.st_mtime_ns, st.st_size
+
+def _open_archive(archive):
+    # 每個執行緒各自持有 handle (tarfile 非執行緒安全)，避免重複解析目錄；封存檔被改寫時關閉舊 handle 重開
+    cache = _archive_handles.__dict__.setdefault('h', {}); sig = _archive_sig(archive); cur = cache.get(archive)
+    if cur is None or cur[0] != sig:
+        if cur: cur[1].close()
+        cur = cache[archive] = (sig, zipfile.ZipFile(archive) if str(archive).lower().endswith('.zip') else tarfile.open(archive))
+    return cur
+
+def close_archives():
+    # 關閉目前執行緒持有的所有 handle；常駐執行緒讀完即關，避免 Windows 上鎖住封存檔
+    for _, h in _archive_handles.__dict__.pop('h', {}).values(): h.close()
+
+class ArchiveMember:
+    def __init__(self, archive, member, info=None, sig=None):
+        # info/sig: 列舉時的 TarInfo 與封存檔簽章；封存檔之後被改寫則改以名稱查找
+        self.archive = Path(archive); self.member = PurePosixPath(member); self.info = info; self.sig = sig
+        self.name, self.stem, self.suffix, self.parent = self.member.name, self.member.stem, self.member.suffix, self.member.parent
+
+    def __repr__(self): return f"{self.archive}!{self.member}"
+    def __eq__(self, o): return isinstance(o, ArchiveMember) and (o.archive, o.member) == (self.archive, self.member)
+    def __hash__(self): return hash((self.archive, self.member))
+
+    def relative_to(self, _root): return self.member
+    def resolve(self): return self
+    def stat(self): return self.archive.stat()
+
+    def open(self):
+        sig, h = _open_archive(self.archive)
+        if isinstance(h, zipfile.ZipFile): return h.open(str(self.member))
+        return h.extractfile(self.info if self.info and sig == self.sig else str(self.member))
+
+    def read_bytes(self):
+        with self.open() as f: return f.read()
+
+def path_from_str(s):
+    # str(ArchiveMember) 的逆轉換 ("x.zip!a/b.png")，供跨行程傳遞的檔案清單還原
+    i = s.find('!')
+    while i != -1:
+        if is_archive(s[:i]) and Path(s[:i]).is_file(): return ArchiveMember(s[:i], s[i + 1:])
+        i = s.find('!', i + 1)
+    return Path(s)
+
+def list_archive(path, recursive=True, valid_exts=None):
+    path = Path(path); out = []; sig = _archive_sig(path)
+    if path.suffix.lower() == '.zip':
+        with zipfile.ZipFile(path) as z: entries = [(i.filename, None) for i in z.infolist() if not i.is_dir()]
+    else:
+        with tarfile.open(path) as t: entries = [(i.name, i) for i in t.getmembers() if i.isfile()]
+    for name, info in entries:
+        m = PurePosixPath(name)
+        if m.name.startswith('.') or '__MACOSX' in m.parts: continue
+        if not recursive and len(m.parts) > 1: continue
+        if valid_exts is None or m.suffix.lower() in valid_exts: out.append(ArchiveMember(path, name, info, sig))
+    return out
+
+def rel_parent(fp, input_path):
+    # 輸出子路徑：資料夾輸入保留相對結構；封存輸入沿用成員目錄；單檔輸入取上層資料夾名
+    if isinstance(fp, ArchiveMember): return Path(*fp.parent.parts) if fp.parent.parts else Path()
+    return fp.relative_to(Path(input_path)).parent if Path(input_path).is_dir() else Path(fp.parent.name)
+
+def remove_source(fp):
+    # 封存檔內的成員不支援單獨刪除，略過
+    if not isinstance(fp, ArchiveMember): os.remove(fp)
+
+def prepare_output(output_path):
+    out_base = Path(output_path)
+    if is_archive(out_base): out_base.parent.mkdir(parents=True, exist_ok=True)
+    else: out_base.mkdir(parents=True, exist_ok=True)
+    return out_base
 
 def get_files(input_path, recursive=False, file_types='image'):
+    return list(iter_files(input_path, recursive, file_types))
+
+def first_file(input_path, recursive=False, file_types='image'):
+    # 找到第一個符合的檔案即停止，不列舉整棵目錄樹
+    return next(iter_files(input_path, recursive, file_types), None)
+
+def iter_files(input_path, recursive=False, file_types='image'):
     path = Path(input_path)
     if not path.exists():
-        return []
+        return
         
     valid_exts = set()
     if file_types == 'image':
@@ -21,15 +117,18 @@ def get_files(input_path, recursive=False, file_types='image'):
         valid_exts.update(VALID_VIDEO_EXTS)
     # 若 file_types == 'all'，我們保持 valid_exts 為空，但在下方邏輯做特殊處理
 
+    # 如果輸入是封存檔 (僅圖片任務)：列出成員，不解壓
+    if path.is_file() and file_types == 'image' and is_archive(path):
+        yield from list_archive(path, recursive, valid_exts); return
+
     # 如果輸入是單一檔案
     if path.is_file():
         # 如果是 'all'，直接接受；否則檢查副檔名
-        if file_types == 'all':
-            return [path]
-        return [path] if path.suffix.lower() in valid_exts else []
+        if file_types == 'all' or path.suffix.lower() in valid_exts:
+            yield path
+        return
     
     # 如果輸入是資料夾
-    files = []
     pattern = "**/*" if recursive else "*"
     
     for p in path.glob(pattern):
@@ -38,25 +137,101 @@ def get_files(input_path, recursive=False, file_types='image'):
             if file_types == 'all':
                 # 排除隱藏檔 (.DS_Store 等)
                 if not p.name.startswith('.'):
-                    files.append(p)
+                    yield p
             else:
                 if p.suffix.lower() in valid_exts:
-                    files.append(p)
-            
-    return files
+                    yield p
 
 def is_ffmpeg_installed():
     return shutil.which("ffmpeg") is not None
 
-def get_video_duration(file_path):
+def _to_float(v, default=0.0):
+    try: return float(v)
+    except (TypeError, ValueError): return default
+
+def _parse_probe(data):
+    fmt = data.get('format', {}); streams = data.get('streams', [])
+    v = next((st for st in streams if st.get('codec_type') == 'video' and not st.get('disposition', {}).get('attached_pic')), {})
+    a = next((st for st in streams if st.get('codec_type') == 'audio'), {})
+    num, _, den = (v.get('avg_frame_rate') or '0/1').partition('/')
+    return {
+        'duration': _to_float(fmt.get('duration')) or _to_float(v.get('duration')),
+        'format_name': fmt.get('format_name', ''),
+        'bit_rate': int(_to_float(fmt.get('bit_rate'))),
+        'vcodec': v.get('codec_name', ''), 'width': int(v.get('width') or 0), 'height': int(v.get('height') or 0),
+        'pix_fmt': v.get('pix_fmt', ''), 'fps': _to_float(num) / _to_float(den, 1.0) if _to_float(den) else 0.0,
+        'v_bit_rate': int(_to_float(v.get('bit_rate'))),
+        'acodec': a.get('codec_name', ''), 'a_bit_rate': int(_to_float(a.get('bit_rate'))),
+        'audio_streams': sum(1 for st in streams if st.get('codec_type') == 'audio'),
+        'subtitle_streams': sum(1 for st in streams if st.get('codec_type') == 'subtitle'),
+        'scodecs': [st.get('codec_name', '') for st in streams if st.get('codec_type') == 'subtitle'],
+    }
+
+def _run_ffprobe(file_path):
+    # 一次 ffprobe 取得 format + streams，時長/編碼/解析度/位元率一起拿
+    cmd = ["ffprobe", "-v", "error", "-show_format", "-show_streams", "-of", "json", str(file_path)]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0 or not result.stdout.strip():
+        raise RuntimeError(result.stderr.strip() or f"ffprobe 失敗 (code {result.returncode})")
+    return _parse_probe(json.loads(result.stdout))
+
+class ProbeCache:
+    # 影片探測結果的磁碟快取，以 路徑 + 大小 + 修改時間 為鍵，檔案變動即自動失效
+    def __init__(self, path=None):
+        base = Path(os.environ.get('FILE_APP_CACHE_DIR') or Path.home() / '.cache' / 'file_app')
+        self.path = Path(path) if path else base / 'probe_cache.json'
+        self.lock = threading.Lock(); self.dirty = False
+        try: self.data = json.loads(self.path.read_text(encoding='utf-8'))
+        except (OSError, ValueError): self.data = {}
+
+    @staticmethod
+    def _key(file_path):
+        st = Path(file_path).stat(); return str(Path(file_path).resolve()), [st.st_size, st.st_mtime_ns]
+
+    def get(self, file_path):
+        k, sig = self._key(file_path); e = self.data.get(k)
+        return e['info'] if e and e.get('sig') == sig else None
+
+    def put(self, file_path, info):
+        k, sig = self._key(file_path)
+        with self.lock: self.data[k] = {'sig': sig, 'info': info}; self.dirty = True
+
+    def save(self):
+        if not self.dirty: return
+        with self.lock:
+            # 暫存檔名唯一，避免同機多個行程 (監看/分散式 worker) 交錯寫入同一暫存檔
+            tmp = self.path.with_name(f"{self.path.stem}.{uuid.uuid4().hex}.tmp")
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                tmp.write_text(json.dumps(self.data, ensure_ascii=False), encoding='utf-8'); os.replace(tmp, self.path); self.dirty = False
+            except OSError:
+                try: tmp.unlink()
+                except OSError: pass
+
+_probe_cache = None
+
+def get_probe_cache():
+    global _probe_cache
+    if _probe_cache is None: _probe_cache = ProbeCache()
+    return _probe_cache
+
+def probe_media(file_path, cache=None):
+    cache = cache or get_probe_cache()
     try:
-        cmd = [
-            "ffprobe", "-v", "error", 
-            "-show_entries", "format=duration", 
-            "-of", "default=noprint_wrappers=1:nokey=1", 
-            str(file_path)
-        ]
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        return float(result.stdout.strip())
-    except:
-        return 0.0
\ No newline at end of file
+        info = cache.get(file_path)
+        if info is None: info = _run_ffprobe(file_path); cache.put(file_path, info)
+        return info
+    except Exception:
+        return _parse_probe({})
+
+def probe_many(paths, max_workers=None, cache=None):
+    # 快取未命中的檔案才平行啟動 ffprobe；回傳 {path: info}
+    cache = cache or get_probe_cache(); paths = list(paths)
+    with ThreadPoolExecutor(max_workers=max_workers or min(8, (os.cpu_count() or 2) * 2)) as ex:
+        infos = list(ex.map(lambda p: probe_media(p, cache), paths))
+    cache.save()
+    return dict(zip(paths, infos))
+
+def get_video_duration(file_path):
+    info = probe_media(file_path); get_probe_cache().save()
+    return info['duration']
\ No newline at end of file
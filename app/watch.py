@@ -0,0 +1,180 @@
+import os
+import sys
+import time
+import json
+import select
+import struct
+import ctypes
+import ctypes.util
+from collections import deque
+from pathlib import Path
+from app.utils import get_files, is_archive, VALID_IMG_EXTS, VALID_VIDEO_EXTS
+
+# -----------------------------------------------------------------------------
+# 監看來源：Linux 用 inotify (ctypes 直呼 libc)，其他平台或失敗時退回輪詢
+# -----------------------------------------------------------------------------
+IN_MODIFY, IN_ATTRIB, IN_CLOSE_WRITE, IN_MOVED_TO, IN_CREATE = 0x002, 0x004, 0x008, 0x080, 0x100
+IN_Q_OVERFLOW, IN_ISDIR = 0x4000, 0x40000000
+_IN_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+_EVT = struct.Struct('iIII')
+
+class InotifySource:
+    def __init__(self, root, recursive):
+        self.root = Path(root); self.recursive = recursive; self.wds = {}
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0: raise OSError(ctypes.get_errno(), "inotify_init1 失敗")
+        self._add_tree(self.root)
+
+    def _add_tree(self, d):
+        dirs = [d] + ([p for p in d.rglob('*') if p.is_dir()] if self.recursive else [])
+        for p in dirs:
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(str(p)), _IN_MASK)
+            if wd >= 0: self.wds[wd] = p
+
+    def poll(self, timeout):
+        # 回傳有變動的檔案路徑；None 表示事件溢位，呼叫端應全量重掃
+        r, _, _ = select.select([self.fd], [], [], timeout)
+        if not r: return []
+        try: data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError: return []
+        out = []; off = 0
+        while off + _EVT.size <= len(data):
+            wd, mask, _, ln = _EVT.unpack_from(data, off); off += _EVT.size
+            name = data[off:off + ln].rstrip(b'\0').decode(errors='replace'); off += ln
+            if mask & IN_Q_OVERFLOW: return None
+            base = self.wds.get(wd)
+            if base is None or not name: continue
+            p = base / name
+            if mask & IN_ISDIR:
+                # 新子資料夾：補掛 watch，並把已經複製進去的檔案一併回報
+                if self.recursive and mask & (IN_CREATE | IN_MOVED_TO):
+                    self._add_tree(p); out.extend(f for f in p.rglob('*') if f.is_file())
+            else: out.append(p)
+        return out
+
+    def close(self): os.close(self.fd)
+
+class PollingSource:
+    def __init__(self, root, recursive, interval=1.0):
+        self.root = root; self.recursive = recursive; self.interval = interval; self.snap = self._scan(); self.next_at = 0.0
+
+    def _scan(self):
+        snap = {}
+        for p in get_files(self.root, self.recursive, file_types='all'):
+            try: st = p.stat(); snap[p] = (st.st_size, st.st_mtime_ns)
+            except OSError: pass
+        return snap
+
+    def poll(self, timeout):
+        wait = self.next_at - time.monotonic()
+        if wait > 0: time.sleep(min(wait, timeout))
+        if time.monotonic() < self.next_at: return []
+        self.next_at = time.monotonic() + self.interval
+        new = self._scan(); changed = [p for p, sig in new.items() if self.snap.get(p) != sig]; self.snap = new
+        return changed
+
+    def close(self): pass
+
+def open_source(root, recursive, poll_interval=1.0, log_callback=None):
+    if sys.platform.startswith('linux'):
+        try: return InotifySource(root, recursive)
+        except (OSError, AttributeError) as e:
+            log_callback and log_callback(f"⚠️ inotify 無法使用，改用輪詢: {e}")
+    return PollingSource(root, recursive, poll_interval)
+
+# -----------------------------------------------------------------------------
+# 穩定判定：大小與修改時間在 settle 秒內都沒變才視為複製完成
+# -----------------------------------------------------------------------------
+class StabilityTracker:
+    def __init__(self, settle=2.0):
+        self.settle = settle; self.pending = {}; self.done = {}
+
+    def touch(self, p, now):
+        try: st = p.stat(); sig = (st.st_size, st.st_mtime_ns)
+        except OSError: self.pending.pop(p, None); return
+        if self.done.get(p) == sig: return
+        first, last_sig, since = self.pending.get(p, (now, None, now))
+        self.pending[p] = (first, sig, since if sig == last_sig else now)
+
+    def ready(self, now):
+        out = []
+        for p, (first, sig, since) in list(self.pending.items()):
+            if now - since < self.settle: continue
+            self.touch(p, now)  # 重新 stat，有變動會重置 since
+            cur = self.pending.get(p)
+            if cur and cur[2] == since: del self.pending[p]; self.done[p] = sig; out.append((p, first))
+        return out
+
+# -----------------------------------------------------------------------------
+# 常駐監看迴圈：同一行程內持續執行，避免每批重新啟動與 import
+# -----------------------------------------------------------------------------
+def run_watch(task_func, input_path, output_path=None, recursive=True, file_types='image', settle=2.0, poll_interval=1.0,
+              process_existing=False, should_stop=lambda: False, log_callback=print, stats_callback=None, task_kwargs=None):
+    if output_path and is_archive(output_path):
+        # 每個新檔都是一次獨立的 task 呼叫，封存輸出會被反覆覆寫
+        log_callback("❌ 監看模式不支援封存檔輸出，請改用資料夾"); return
+    root = Path(input_path); out_root = Path(output_path).resolve() if output_path else None; task_kwargs = dict(task_kwargs or {})
+    valid = {'image': VALID_IMG_EXTS, 'video': VALID_VIDEO_EXTS}.get(file_types)
+    src = open_source(root, recursive, poll_interval, log_callback); tracker = StabilityTracker(settle)
+    queue = deque(); lat = deque(maxlen=200); stats = {'processed': 0, 'failed': 0}; now = time.monotonic()
+
+    def wanted(p):
+        if p.name.startswith('.') or (valid is not None and p.suffix.lower() not in valid): return False
+        # 輸出資料夾若位於輸入資料夾內，跳過輸出檔避免自我觸發
+        return not (out_root and out_root in p.resolve().parents)
+
+    for p in get_files(root, recursive, file_types):
+        if not wanted(p): continue
+        if process_existing: tracker.touch(p, now)
+        else:
+            try: st = p.stat(); tracker.done[p] = (st.st_size, st.st_mtime_ns)
+            except OSError: pass
+    log_callback(f"👀 [Watch] 監看中: {root} ({type(src).__name__})")
+
+    def emit_stats():
+        if not stats_callback: return
+        s = sorted(lat)
+        stats_callback({**stats, 'queue': len(queue), 'pending': len(tracker.pending),
+                        'avg_latency': sum(s) / len(s) if s else 0.0, 'p95_latency': s[min(len(s) - 1, int(len(s) * 0.95))] if s else 0.0})
+
+    try:
+        while not should_stop():
+            changed = src.poll(0 if queue else min(0.5, settle))
+            now = time.monotonic()
+            if changed is None: changed = get_files(root, recursive, file_types)
+            for p in changed:
+                if p.is_file() and wanted(p): tracker.touch(p, now)
+            queue.extend(tracker.ready(now))
+            if queue:
+                fp, first = queue.popleft(); errors = []; task_log = task_kwargs.get('log_callback', log_callback)
+                def log(msg):
+                    # task 內部會自行攔截單檔例外只記錄 ❌，以此判定失敗
+                    if msg.startswith("❌"): errors.append(msg)
+                    task_log(msg)
+                kw = {**task_kwargs, 'log_callback': log}
+                try:
+                    # 以監看根目錄為 input_path，輸出子路徑與批次執行一致
+                    task_func(input_path=str(root), files=[fp], output_path=output_path, **kw) if output_path else task_func(input_path=str(root), files=[fp], **kw)
+                except Exception as e: errors.append(str(e)); log_callback(f"❌ {fp.name}: {e}")
+                ok = not errors
+                stats['processed' if ok else 'failed'] += 1; lat.append(time.monotonic() - first)
+                emit_stats()
+            elif changed: emit_stats()
+    finally:
+        src.close()
+    log_callback("🏁 [Watch] 停止監看")
+
+def _noop(*_): pass
+
+if __name__ == "__main__":
+    # 無介面常駐模式: python -m app.watch config.json
+    # config: {"task": "task_scaling", "input_path": ..., "output_path": ..., "settle": 2, "kwargs": {...}}
+    import app.logic as logic
+    cfg = json.loads(Path(sys.argv[1]).read_text(encoding='utf-8'))
+    func = getattr(logic, cfg['task'])
+    run_watch(func, cfg['input_path'], cfg.get('output_path'), recursive=cfg.get('recursive', True), file_types=cfg.get('file_types', 'image'),
+              settle=cfg.get('settle', 2.0), poll_interval=cfg.get('poll_interval', 1.0), process_existing=cfg.get('process_existing', False),
+              stats_callback=lambda s: print(f"📊 {s}"),
+              task_kwargs={'log_callback': print, 'progress_callback': _noop, 'current_file_callback': _noop, 'file_progress_callback': _noop,
+                           'recursive': False, **cfg.get('kwargs', {})})
@@ -1,4 +1,10 @@
+import threading
+import time
 from PySide6.QtCore import QThread, Signal
+from PySide6.QtGui import QImage
+import app.logic as logic
+from app.watch import run_watch
+from app.utils import first_file, close_archives
 
 class Worker(QThread):
     log_signal = Signal(str)
@@ -24,4 +30,92 @@ class Worker(QThread):
         except Exception as e:
             self.log_signal.emit(f"❌ 執行緒發生嚴重錯誤: {str(e)}")
         finally:
-            self.finished_signal.emit()
\ No newline at end of file
+            self.finished_signal.emit()
+
+# 常駐預覽執行緒：在縮圖代理上渲染 Smart Fill；只保留最新請求，過期結果直接丟棄
+# 樣本圖的搜尋也在此執行緒進行 (只取第一個符合檔案)，輸入路徑很大時不會卡住介面
+class PreviewWorker(QThread):
+    result_signal = Signal(object, float, str)
+    error_signal = Signal(str)
+    empty_signal = Signal()
+
+    def __init__(self, max_side=480):
+        super().__init__()
+        self.max_side = max_side
+        self._cond = threading.Condition(); self._job = None; self._gen = 0; self._running = True
+        self._proxy_key = None; self._proxy = None; self._sample_src = None; self._sample = None
+
+    def request(self, source, fill_args):
+        # source: (輸入路徑, 含子資料夾)
+        with self._cond:
+            self._gen += 1; self._job = (self._gen, source, fill_args); self._cond.notify()
+
+    def stop(self):
+        with self._cond:
+            self._running = False; self._cond.notify()
+        self.wait()
+
+    def _get_proxy(self, path):
+        # 代理圖與 alpha 遮罩在樣本圖未變動前重複使用
+        key = (str(path), path.stat().st_mtime, self.max_side)  # 封存成員取封存檔的 mtime
+        if key != self._proxy_key:
+            try: self._proxy = logic.make_preview_proxy(path, self.max_side); self._proxy_key = key
+            finally: close_archives()  # 預覽執行緒常駐，讀完即關閉封存檔
+        return self._proxy
+
+    def _get_sample(self, source):
+        if source != self._sample_src:
+            self._sample = first_file(source[0], source[1], file_types='image'); self._sample_src = source
+        return self._sample
+
+    def run(self):
+        while True:
+            with self._cond:
+                while self._running and self._job is None: self._cond.wait()
+                if not self._running: return
+                gen, source, fill_args = self._job; self._job = None
+            try:
+                path = self._get_sample(source)
+                if path is None:
+                    if gen == self._gen: self.empty_signal.emit()
+                    continue
+                t0 = time.perf_counter()
+                proxy, masks = self._get_proxy(path)
+                res = logic.process_single_image_fill(proxy, *fill_args, masks=masks)
+                if gen != self._gen: continue
+                if res.mode != 'RGBA': res = res.convert('RGBA')
+                qimg = QImage(res.tobytes('raw', 'RGBA'), res.width, res.height, res.width * 4, QImage.Format_RGBA8888).copy()
+                self.result_signal.emit(qimg, (time.perf_counter() - t0) * 1000, path.name)
+            except Exception as e:
+                if gen == self._gen: self.error_signal.emit(str(e))
+
+
+# 監看模式：執行緒常駐，持續把新進且穩定的檔案逐一交給同一個 task 處理
+class WatchWorker(QThread):
+    log_signal = Signal(str)
+    progress_signal = Signal(int)
+    current_file_signal = Signal(str)
+    file_progress_signal = Signal(int)
+    stats_signal = Signal(object)
+    finished_signal = Signal()
+
+    def __init__(self, task_func, file_types='image', settle=2.0, **kwargs):
+        super().__init__()
+        self.task_func = task_func
+        self.file_types = file_types
+        self.settle = settle
+        self.kwargs = kwargs
+
+    def run(self):
+        kw = dict(self.kwargs)
+        try:
+            run_watch(self.task_func, kw.pop('input_path'), kw.pop('output_path', None), recursive=kw.get('recursive', True),
+                      file_types=self.file_types, settle=self.settle, should_stop=self.isInterruptionRequested,
+                      log_callback=self.log_signal.emit, stats_callback=self.stats_signal.emit,
+                      task_kwargs={'log_callback': self.log_signal.emit, 'progress_callback': self.progress_signal.emit,
+                                   'current_file_callback': self.current_file_signal.emit,
+                                   'file_progress_callback': self.file_progress_signal.emit, **kw})
+        except Exception as e:
+            self.log_signal.emit(f"❌ 監看執行緒發生嚴重錯誤: {str(e)}")
+        finally:
+            self.finished_signal.emit()